@@ -0,0 +1,51 @@
+"""Startup benchmark for loading the stdlib pdb code object.
+Compares compiling pdb.py from source (the old import path) with
+get_stdlib_code(), which reuses the cached bytecode in __pycache__.
+Then times "import pdbp" in fresh interpreters.
+Usage: python benchmarks/bench_import.py [runs]"""
+import os
+import subprocess
+import sys
+import time
+import timeit
+
+src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, src_dir)
+import pdbp  # noqa: E402
+
+
+def compile_from_source(pyfile):
+    with open(pyfile) as f:
+        src = f.read()
+    return compile(src, pyfile, "exec", dont_inherit=True)
+
+
+def import_time(runs):
+    """Best wall time of "import pdbp" in a new interpreter, in ms."""
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, "-c", "import pdbp"], env=env)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    pyfile = os.path.join(os.path.dirname(pdbp.code.__file__), "pdb.py")
+    compiled = min(timeit.repeat(
+        lambda: compile_from_source(pyfile), number=1, repeat=runs
+    ))
+    cached = min(timeit.repeat(
+        lambda: pdbp.get_stdlib_code("pdb", pyfile), number=1, repeat=runs
+    ))
+    print("Python %s" % sys.version.split()[0])
+    print("compile pdb.py from source  %8.2fms" % (compiled * 1000))
+    print("get_stdlib_code (cached)    %8.2fms" % (cached * 1000))
+    print("import pdbp (new process)   %8.2fms" % import_time(runs))
+
+
+if __name__ == "__main__":
+    main()
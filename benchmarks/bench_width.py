@@ -0,0 +1,85 @@
+"""Micro-benchmarks for the display-width helpers.
+Times get_width() and set_line_width() over ASCII, CJK, and very long
+lines, next to the per-character helpers that they replaced.
+Usage: python benchmarks/bench_width.py [repeat]"""
+import os
+import sys
+import timeit
+
+src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, src_dir)
+import pdbp  # noqa: E402
+
+
+def old_is_char_wide(char):
+    special_c_r = [
+        {"from": ord("\u4e00"), "to": ord("\u9fff")},
+        {"from": ord("\u3040"), "to": ord("\u30ff")},
+        {"from": ord("\uac00"), "to": ord("\ud7a3")},
+        {"from": ord("\uff01"), "to": ord("\uff60")},
+    ]
+    sc = any(
+        [range["from"] <= ord(char) <= range["to"] for range in special_c_r]
+    )
+    return sc
+
+
+def old_get_width(line):
+    line_length = len(line)
+    for char in line:
+        if old_is_char_wide(char):
+            line_length += 1
+    return line_length
+
+
+def old_set_line_width(line, width, tll=True):
+    line_width = old_get_width(line)
+    new_line = ""
+    width = int(width)
+    if width <= 0:
+        return new_line
+    elif line_width == width:
+        return line
+    elif line_width < width:
+        new_line = line
+    else:
+        for char in line:
+            updated_line = "%s%s" % (new_line, char)
+            if old_get_width(updated_line) > width:
+                break
+            new_line = updated_line
+    extra_spaces = ""
+    if tll:
+        extra_spaces = " " * (width - old_get_width(new_line))
+    return "%s%s" % (new_line, extra_spaces)
+
+
+cases = [
+    ("ascii line, trim", "x = compute(value) + 1  # " * 8, 80),
+    ("cjk line, pad", "名前 = '中文の文字列' 한국어", 80),
+    ("15KB ascii line, pad", "a" * 15000, 16000),
+    ("8000-char cjk, trim", "中" * 8000, 80),
+]
+
+
+def best(func, repeat):
+    number = 10
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print("%-22s %12s %12s" % ("set_line_width", "before", "after"))
+    for name, line, width in cases:
+        before = best(lambda: old_set_line_width(line, width), repeat)
+        after = best(lambda: pdbp.set_line_width(line, width), repeat)
+        print("%-22s %10.1fus %10.1fus" % (name, before * 1e6, after * 1e6))
+    print("%-22s %12s %12s" % ("get_width", "before", "after"))
+    for name, line, width in cases:
+        before = best(lambda: old_get_width(line), repeat)
+        after = best(lambda: pdbp.get_width(line), repeat)
+        print("%-22s %10.1fus %10.1fus" % (name, before * 1e6, after * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -84,7 +84,7 @@ setup(
         "PyPI": "https://pypi.org/project/pdbp/",
         "Source": "https://github.com/mdmintz/pdbp",
     },
-    py_modules=["pdbp"],
+    py_modules=["pdbp", "pdbp_lazy"],
     package_dir={"": "src"},
     platforms=["Windows", "Linux", "Mac OS-X"],
     author="Michael Mintz",
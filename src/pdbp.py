@@ -2,19 +2,33 @@
 pdbp (Pdb+): A drop-in replacement for pdb and pdbpp.
 =====================================================
 """
+import atexit
+import bdb
+import bisect
+import builtins
 import code
 import codecs
+import gc
+import importlib.machinery
 import inspect
+import itertools
+import keyword
 import math
 import os
 import pprint
 import re
+import reprlib
+import rlcompleter
 import shutil
 import signal
 import sys
+import threading
+import time
 import traceback
 import types
-from collections import OrderedDict
+import warnings
+import weakref
+from collections import ChainMap, OrderedDict, deque
 from inspect import signature
 from io import StringIO
 from tabcompleter import Completer, ConfigurableClass, Color
@@ -28,13 +42,28 @@ run_from_main = False
 side_effects_free = re.compile(r"^ *[_0-9a-zA-Z\[\].]* *$")
 
 
+def get_stdlib_code(name, pyfile):
+    """Return the code object of a stdlib module.
+    Uses the cached bytecode from __pycache__ when it is still valid.
+    (The cache is keyed by the interpreter's magic number and by the
+    mtime/size or hash of the source file.) Falls back to compiling."""
+    try:
+        loader = importlib.machinery.SourceFileLoader(name, pyfile)
+        co_module = loader.get_code(name)
+        if co_module is not None:
+            return co_module
+    except Exception:
+        pass
+    with open(pyfile) as f:
+        src = f.read()
+    return compile(src, pyfile, "exec", dont_inherit=True)
+
+
 def import_from_stdlib(name):
     result = types.ModuleType(name)
     stdlibdir, _ = os.path.split(code.__file__)
     pyfile = os.path.join(stdlibdir, name + ".py")
-    with open(pyfile) as f:
-        src = f.read()
-    co_module = compile(src, pyfile, "exec", dont_inherit=True)
+    co_module = get_stdlib_code(name, pyfile)
     exec(co_module, result.__dict__)
     return result
 
@@ -48,60 +77,240 @@ def rebind_globals(func, newglobals):
     return newfunc
 
 
+_wide_chars = {}
+
+
 def is_char_wide(char):
     # Returns True if the char is Chinese, Japanese, Korean, or another double.
-    special_c_r = [
-        {"from": ord("\u4e00"), "to": ord("\u9FFF")},
-        {"from": ord("\u3040"), "to": ord("\u30ff")},
-        {"from": ord("\uac00"), "to": ord("\ud7a3")},
-        {"from": ord("\uff01"), "to": ord("\uff60")},
-    ]
-    sc = any(
-        [range["from"] <= ord(char) <= range["to"] for range in special_c_r]
-    )
-    return sc
+    # (East Asian Wide/Fullwidth. Results are memoized per character.)
+    try:
+        return _wide_chars[char]
+    except KeyError:
+        import unicodedata
+        wide = unicodedata.east_asian_width(char) in ("W", "F")
+        _wide_chars[char] = wide
+        return wide
 
 
 def get_width(line):
     # Return the true width of the line. Not the same as line length.
     # Chinese/Japanese/Korean characters take up two spaces of width.
-    line_length = len(line)
-    for char in line:
-        if is_char_wide(char):
-            line_length += 1
-    return line_length
+    if line.isascii():
+        return len(line)
+    return len(line) + sum(map(is_char_wide, line))
 
 
 def set_line_width(line, width, tll=True):
     """Trim line if too long. Fill line if too short. Return line."""
-    line_width = get_width(line)
-    new_line = ""
     width = int(width)
     if width <= 0:
-        return new_line
-    elif line_width == width:
-        return line
-    elif line_width < width:
-        new_line = line
+        return ""
+    if line.isascii():
+        line = line[:width]
+        line_width = len(line)
     else:
-        for char in line:
-            updated_line = "%s%s" % (new_line, char)
-            if get_width(updated_line) > width:
+        line_width = 0
+        for i, char in enumerate(line):
+            char_width = 2 if is_char_wide(char) else 1
+            if line_width + char_width > width:
+                line = line[:i]
                 break
-            new_line = updated_line
-    extra_spaces = ""
-    if tll:
-        extra_spaces = " " * (width - get_width(new_line))
-    return "%s%s" % (new_line, extra_spaces)
+            line_width += char_width
+    if tll and line_width < width:
+        return line + " " * (width - line_width)
+    return line
 
 
-def get_terminal_size():
-    if "linux" in sys.platform:
-        return shutil.get_terminal_size((80, 20))
+class LRUCache(OrderedDict):
+    """An OrderedDict that keeps up to `maxsize` recently-used items."""
+
+    def __init__(self, maxsize=128):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        self.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > max(self.maxsize, 0):
+            self.popitem(last=False)
+
+
+def fit_tokens(tokens, width):
+    """Trim and pad each line of a (ttype, value) token stream to width,
+    like set_line_width() does for a line of text."""
+    from pygments.token import Text
+    used = 0
+    for ttype, value in tokens:
+        for i, part in enumerate(value.split("\n")):
+            if i:
+                if used < width:
+                    yield Text, " " * (width - used)
+                yield ttype, "\n"
+                used = 0
+            if part and used < width:
+                part = set_line_width(part, width - used, False)
+                used += get_width(part)
+                yield ttype, part
+
+
+class TokenCache(object):
+    """On-disk cache of pygments token streams, shared across sessions.
+    Entries are keyed by a hash of the source text, the lexer, the style
+    and the pygments version. When the cache grows past `max_size` bytes,
+    the least-recently used files are removed first."""
+    suffix = ".tokens"
+
+    def __init__(self, dirname, max_size, style=""):
+        self.dirname = os.path.expanduser(dirname)
+        self.max_size = max_size
+        self.style = style
+        self._ttypes = {}
+
+    def _get_path(self, src, lexer):
+        import hashlib
+        import pygments
+        key = "%s\0%s\0%s\0%s\0%s" % (
+            pygments.__version__, type(lexer).__name__,
+            sorted(lexer.options.items()), self.style, src,
+        )
+        digest = hashlib.sha1(key.encode("utf-8", "surrogatepass"))
+        return os.path.join(self.dirname, digest.hexdigest() + self.suffix)
+
+    def _get_ttype(self, names):
+        ttype = self._ttypes.get(names)
+        if ttype is None:
+            from pygments.token import Token
+            ttype = Token
+            for name in names:
+                ttype = getattr(ttype, name)
+            self._ttypes[names] = ttype
+        return ttype
+
+    def get_tokens(self, src, lexer):
+        """Return the (ttype, value) token list for src. Lex on a miss."""
+        import marshal
+        path = self._get_path(src, lexer)
+        try:
+            with open(path, "rb") as f:
+                names, kinds, values = marshal.load(f)
+            os.utime(path)
+            ttypes = [self._get_ttype(n) for n in names]
+            return list(zip(map(ttypes.__getitem__, kinds), values))
+        except Exception:
+            pass
+        tokens = list(lexer.get_tokens(src))
+        indexes = {}
+        kinds = [indexes.setdefault(t, len(indexes)) for t, _ in tokens]
+        values = [value for _, value in tokens]
+        names = [tuple(ttype) for ttype in indexes]
+        try:
+            os.makedirs(self.dirname, exist_ok=True)
+            tmp_path = "%s.%s.tmp" % (path, os.getpid())
+            with open(tmp_path, "wb") as f:
+                marshal.dump((names, kinds, values), f)
+            os.replace(tmp_path, path)
+            self.prune()
+        except Exception:
+            pass
+        return tokens
+
+    def prune(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.dirname):
+            if entry.name.endswith(self.suffix):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        entries.sort()
+        while entries and total > self.max_size:
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def get_mtime(filename):
     try:
-        return os.get_terminal_size()
-    except Exception:
-        return shutil.get_terminal_size((80, 20))
+        return os.stat(filename).st_mtime
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+class TerminalGeometry(object):
+    """Keeps the terminal size, so that renders don't query it each time.
+    The size is refreshed on SIGWINCH when the handler can be installed
+    (from the main thread). Otherwise, it's queried once per interaction."""
+
+    def __init__(self):
+        self.size = None
+        self.fixed_size = None  # The terminal of a remote client
+        self.watching = False
+        self.can_watch = hasattr(signal, "SIGWINCH")
+        self._previous_handler = None
+
+    @staticmethod
+    def query():
+        if "linux" in sys.platform:
+            return shutil.get_terminal_size((80, 20))
+        try:
+            return os.get_terminal_size()
+        except Exception:
+            return shutil.get_terminal_size((80, 20))
+
+    def _on_sigwinch(self, signum, frame):
+        self.size = None
+        if callable(self._previous_handler):
+            self._previous_handler(signum, frame)
+
+    def watch(self):
+        if self.watching or not self.can_watch:
+            return
+        try:
+            self._previous_handler = signal.signal(
+                signal.SIGWINCH, self._on_sigwinch
+            )
+        except (ValueError, OSError):  # Not in the main thread
+            return
+        self.watching = True
+
+    def refresh(self):
+        """Called once per interaction."""
+        if (
+            self.watching
+            and signal.getsignal(signal.SIGWINCH) != self._on_sigwinch
+        ):
+            # The program replaced the handler. Don't fight over it.
+            self.watching = False
+            self.can_watch = False
+        self.watch()
+        if not self.watching:
+            self.size = None
+
+    def get(self):
+        if self.fixed_size is not None:
+            return self.fixed_size
+        size = self.size
+        if size is None:
+            size = self.size = self.query()
+        return size
+
+
+terminal = TerminalGeometry()
+
+
+def get_terminal_size():
+    return terminal.get()
 
 
 class DefaultConfig(object):
@@ -144,51 +353,2699 @@ class DefaultConfig(object):
     last_return_color = None
     show_traceback_on_error = True
     show_traceback_on_error_limit = None
+    highlight_cache_size = 64  # Max code objects with cached sticky lines
+    token_cache = False  # Keep lexed source on disk, shared by sessions
+    token_cache_dir = "~/.cache/pdbp"
+    token_cache_max_size = 32 * 1024 * 1024  # In bytes (LRU eviction)
+    token_cache_min_length = 8192  # Smaller sources are just re-lexed
+    incremental_render = True  # Sticky mode only redraws the changed rows
+    # "monitoring" uses sys.monitoring (Python 3.12+) for next/continue,
+    # so that code without breakpoints runs at (near) full speed.
+    trace_backend = "settrace"
+    logpoint_buffer_size = 10000  # Number of records kept for "logs"
+    logpoint_flush_interval = 0.5  # Seconds between background writes
+    logpoint_file = None  # Append logpoint output here (Default: stdout)
+    # Complete "obj.<Tab>" from the type MRO and obj.__dict__, without
+    # running properties or __getattr__. (A custom __dir__ gets a timeout.)
+    safe_attribute_completion = True
+    completion_dir_timeout = 0.2  # In seconds
+    # Limits for p, pp, display, and return values. (p! and pp! print all)
+    repr_maxlevel = 6  # Nesting levels
+    repr_maxitems = 100  # Items per container
+    repr_maxstring = 1000  # Characters per str/bytes
+    repr_maxchars = 20000  # Characters in total
+    eval_timeout = 10  # Seconds for evaluating expressions (None: no limit)
+    inspect_sample_size = 1000000  # Bigger arrays get sampled by inspect
+    mem_max_objects = 1000000  # Objects visited per "mem" command
+    mem_time_limit = 2.0  # Seconds per "mem" command
+    refs_max_depth = 8  # Levels that "referrers" searches (a gc scan each)
+    refs_max_objects = 100000  # Objects visited per refs/referrers command
+    refs_max_lines = 50  # Lines printed by "refs", and paths by "referrers"
+    profile_interval = 0.005  # Seconds between samples of "profile"
+    profile_top_count = 15  # Rows of the hot functions and lines tables
+    async_stepping = True  # "next"/"step" in an asyncio task stay in it
+    remote_accept_timeout = 60  # Seconds that "listen" waits for a client
+    remote_any_host = False  # Let "listen" take TCP ports of other hosts
     default_pdb_kwargs = {
     }
 
-    def setup(self, pdb):
-        pass
+    def setup(self, pdb):
+        pass
+
+    def before_interaction_hook(self, pdb):
+        pass
+
+
+def setbgcolor(line, color):
+    # Add a bgcolor attribute to all escape sequences found.
+    setbg = "\x1b[%sm" % color
+    regexbg = "\\1;%sm" % color
+    result = setbg + re.sub("(\x1b\\[.*?)m", regexbg, line) + "\x1b[00m"
+    if os.environ.get("TERM") == "eterm-color":
+        result = result.replace(setbg, "\x1b[37;%dm" % color)
+        result = result.replace("\x1b[00;%dm" % color, "\x1b[37;%dm" % color)
+        result = result.replace("\x1b[39;49;00;", "\x1b[37;")
+    return result
+
+
+CLEARSCREEN = "\033[2J\033[1;1H"
+ansi_escape = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+
+
+class FrameRenderer(object):
+    """Writes sticky-mode frames to a terminal.
+    The rows of the last frame are remembered. When the next frame can be
+    drawn over it, only the rows that changed are sent (using cursor
+    addressing), instead of clearing the screen and repainting it all."""
+
+    def __init__(self, incremental=True):
+        self.incremental = incremental
+        self.rows = None  # What's on the screen, starting from the top row
+        self.size = None
+
+    def reset(self):
+        """Forget the last frame, so that the next one is fully painted."""
+        self.rows = None
+
+    @staticmethod
+    def get_rows(text, width):
+        """Split a frame into screen rows. (None if it's too complex.)
+        The last row is the empty one where the cursor (prompt) ends up."""
+        rows = [""]
+        cur = 0
+        for part in re.split("(\n|\033\\[F)", text):
+            if part == "\n":
+                cur += 1
+                if cur == len(rows):
+                    rows.append("")
+            elif part == "\033[F":
+                if cur == 0 or rows[cur - 1]:
+                    return None
+                cur -= 1
+            elif part:
+                if "\033[2J" in part or "\r" in part:
+                    return None
+                rows[cur] += part
+                if get_width(ansi_escape.sub("", rows[cur])) >= width:
+                    return None  # The row would wrap
+        if rows[cur] or any(rows[cur + 1:]):
+            return None
+        return rows[:cur + 1]
+
+    def render(self, stream, text):
+        rows = None
+        size = None
+        if (
+            self.incremental
+            and text.startswith(CLEARSCREEN)
+            and getattr(stream, "isatty", lambda: False)()
+        ):
+            size = tuple(get_terminal_size())
+            rows = self.get_rows(text[len(CLEARSCREEN):], size[0])
+            if rows and len(rows) + 3 >= size[1]:
+                # Leave room for the prompt line and messages (Eg: --Call--)
+                # below the frame, so that the screen doesn't scroll.
+                rows = None
+        if rows and self.rows and size == self.size:
+            old_rows = self.rows
+            out = []
+            for i, row in enumerate(rows[:-1]):
+                if i >= len(old_rows) or row != old_rows[i]:
+                    out.append("\033[%d;1H%s\033[K" % (i + 1, row))
+            out.append("\033[%d;1H\033[J" % len(rows))
+            if sum(map(len, out)) < len(text):
+                text = "".join(out)
+        self.size = size
+        self.rows = None
+        if rows:
+            # The prompt row gets written to, so it's never reused as-is.
+            self.rows = rows[:-1] + [None]
+        stream.write(text)
+        try:
+            stream.flush()
+        except Exception:
+            pass
+
+
+def lasti2lineno(code, lasti):
+    import dis
+    linestarts = list(dis.findlinestarts(code))
+    linestarts.reverse()
+    for i, lineno in linestarts:
+        if lasti >= i:
+            return lineno
+    return 0
+
+
+class Restart(Exception):
+    pass
+
+
+class EvaluationTimeout(Exception):
+    """Raised into an evaluation that ran past its Deadline."""
+
+    def __init__(self, message="The evaluation took too long"):
+        super().__init__(message)
+
+
+class Deadline(object):
+    """Raise EvaluationTimeout into the current thread after timeout seconds.
+    The main thread gets a SIGALRM timer (which also interrupts lock waits).
+    Other threads get an async exception (PyThreadState_SetAsyncExc),
+    which is raised at the next bytecode, so blocking C calls can't be
+    interrupted there. Nested deadlines are part of the outermost one."""
+    local = threading.local()
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.mode = None
+
+    def __enter__(self):
+        if not self.timeout or getattr(self.local, "active", False):
+            return self
+        self.local.active = True
+        self.message = "The evaluation took longer than %ss" % self.timeout
+        if self._start_alarm():
+            self.mode = "alarm"
+        elif self._start_async():
+            self.mode = "async"
+        else:
+            self.local.active = False
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.mode == "alarm":
+            self._stop_alarm()
+        elif self.mode == "async":
+            self._stop_async()
+        if self.mode:
+            self.mode = None
+            self.local.active = False
+        return False
+
+    def _start_alarm(self):
+        if (
+            not hasattr(signal, "setitimer")
+            or threading.current_thread() is not threading.main_thread()
+        ):
+            return False
+        try:
+            self.old_handler = signal.signal(signal.SIGALRM, self._on_alarm)
+        except ValueError:
+            return False
+        self.start_time = time.monotonic()
+        self.old_timer = signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        return True
+
+    def _on_alarm(self, signum, frame):
+        raise EvaluationTimeout(self.message)
+
+    def _stop_alarm(self):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self.old_handler or signal.SIG_DFL)
+        delay, interval = self.old_timer
+        if delay:
+            # Give back the program's own timer (minus the time we took).
+            elapsed = time.monotonic() - self.start_time
+            signal.setitimer(
+                signal.ITIMER_REAL, max(delay - elapsed, 0.001), interval
+            )
+
+    def _start_async(self):
+        try:
+            import ctypes
+            self.set_async_exc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+        except (ImportError, AttributeError):
+            return False
+        self.thread_id = ctypes.c_ulong(threading.get_ident())
+        self.exc = ctypes.py_object(EvaluationTimeout)
+        self.lock = threading.Lock()
+        self.fired = False
+        self.done = False
+        self.timer = threading.Timer(self.timeout, self._on_timer)
+        self.timer.name = "pdbp-deadline"
+        self.timer.daemon = True
+        self.timer.start()
+        return True
+
+    def _on_timer(self):
+        with self.lock:
+            if not self.done:
+                self.fired = True
+                self.set_async_exc(self.thread_id, self.exc)
+
+    def _stop_async(self):
+        with self.lock:
+            self.done = True
+            if self.fired:
+                # Clear the exception, in case it wasn't raised yet.
+                self.set_async_exc(self.thread_id, None)
+        self.timer.cancel()
+
+
+class Undefined:
+    def __repr__(self):
+        return "<undefined>"
+
+
+undefined = Undefined()
+
+
+class MonitoringBackend(object):
+    """Drives a Pdb with sys.monitoring (PEP 669) instead of sys.settrace.
+    Events are only enabled where they are needed:
+    * step: everything (same as sys.settrace).
+    * next/until/return: lines and returns of the frames being stepped.
+    * continue: lines of the code objects that contain breakpoints.
+    (Those code objects are found with PY_START events, which get disabled
+    for each code object as soon as it's seen.) With no breakpoints, all
+    events are turned off, so the program runs at full speed.
+    The first stop of a session still happens with sys.settrace."""
+    STEP = "step"
+    NEXT = "next"
+    CONTINUE = "continue"
+    tool_name = "pdbp"
+    # Frames of the debugger itself are never stopped in.
+    internal_files = frozenset(
+        [__file__, bdb.__file__, pdb.Pdb.__init__.__code__.co_filename]
+    )
+
+    def __init__(self, debugger):
+        self.debugger = debugger
+        self.tool_id = sys.monitoring.DEBUGGER_ID
+        self.events = sys.monitoring.events
+        self.active = False
+        self.mode = None
+        self.thread_id = None
+        self.frame_codes = set()
+        self.local_events = {}  # code --> local events that were set
+        self.dispatching = False
+        self.callbacks = {
+            self.events.PY_START: self._on_start,
+            self.events.PY_RESUME: self._on_start,
+            self.events.PY_RETURN: self._on_return,
+            self.events.PY_YIELD: self._on_return,
+            self.events.PY_UNWIND: self._on_unwind,
+            self.events.LINE: self._on_line,
+            self.events.RAISE: self._on_raise,
+        }
+
+    def start(self):
+        try:
+            sys.monitoring.use_tool_id(self.tool_id, self.tool_name)
+        except ValueError:
+            return False  # Another debugger has the tool id
+        for event, callback in self.callbacks.items():
+            sys.monitoring.register_callback(self.tool_id, event, callback)
+        self.active = True
+        self.thread_id = threading.get_ident()
+        return True
+
+    def stop(self):
+        if not self.active:
+            return
+        self.active = False
+        self.mode = None
+        sys.monitoring.set_events(self.tool_id, 0)
+        for co in self.local_events:
+            sys.monitoring.set_local_events(self.tool_id, co, 0)
+        self.local_events = {}
+        self.frame_codes = set()
+        for event in self.callbacks:
+            sys.monitoring.register_callback(self.tool_id, event, None)
+        sys.monitoring.free_tool_id(self.tool_id)
+
+    def resume(self):
+        """Called when an interaction ends, with the new stepping state."""
+        dbg = self.debugger
+        if dbg.quitting or getattr(dbg, "trace_opcodes", False):
+            # Instruction stepping (stepi) stays on sys.settrace.
+            if self.active and not dbg.quitting:
+                self.stop()
+                frame = dbg.curframe
+                while frame:
+                    frame.f_trace = dbg.trace_dispatch
+                    frame = frame.f_back
+                sys.settrace(dbg.trace_dispatch)
+            else:
+                self.stop()
+            return
+        if not self.active:
+            if sys.gettrace() != dbg.trace_dispatch:
+                return  # Not tracing (Eg: post mortem)
+            if not self.start():
+                return
+        sys.settrace(None)
+        self.update()
+
+    def update(self):
+        """Enable the events needed for the current stepping state."""
+        dbg = self.debugger
+        if dbg.quitting:
+            self.stop()
+            return
+        events = self.events
+        breaks = dbg.breaks
+        local_events = {}
+        if dbg.stopframe is None or dbg._async_task is not None:
+            # (An asyncio task can resume in any frame, or finish.)
+            self.mode = self.STEP
+            self.frame_codes = set()
+            global_events = (
+                events.PY_START | events.PY_RESUME | events.PY_RETURN
+                | events.PY_YIELD | events.PY_UNWIND | events.LINE
+                | events.RAISE
+            )
+        elif dbg.stoplineno == -1 and dbg.stopframe is dbg.botframe:
+            if not breaks:
+                self.stop()
+                return
+            self.mode = self.CONTINUE
+            self.frame_codes = set()
+            global_events = events.PY_START | events.PY_RESUME
+        else:
+            self.mode = self.NEXT
+            self.frame_codes = set()
+            for frame in (dbg.stopframe, dbg.returnframe):
+                if frame is not None:
+                    self.frame_codes.add(frame.f_code)
+                    local_events[frame.f_code] = (
+                        events.LINE | events.PY_RETURN | events.PY_YIELD
+                        | events.PY_RESUME
+                    )
+            global_events = events.PY_UNWIND | events.RAISE
+            if breaks:
+                global_events |= events.PY_START | events.PY_RESUME
+        if breaks:
+            # Code objects that are already running won't see PY_START.
+            frame = sys._getframe()
+            while frame:
+                co = frame.f_code
+                if self._has_breaks(co):
+                    local_events[co] = local_events.get(co, 0) | events.LINE
+                frame = frame.f_back
+        for co in self.local_events:
+            if co not in local_events:
+                sys.monitoring.set_local_events(self.tool_id, co, 0)
+        for co, co_events in local_events.items():
+            sys.monitoring.set_local_events(self.tool_id, co, co_events)
+        self.local_events = local_events
+        sys.monitoring.set_events(self.tool_id, global_events)
+        sys.monitoring.restart_events()
+
+    def _get_breaks(self, code):
+        dbg = self.debugger
+        if not dbg.breaks:
+            return None
+        return dbg.breaks.get(dbg.canonic(code.co_filename))
+
+    def _has_breaks(self, code):
+        breaks = self._get_breaks(code)
+        if not breaks:
+            return False
+        if code.co_firstlineno in breaks:
+            return True
+        for _, _, lineno in code.co_lines():
+            if lineno in breaks:
+                return True
+        return False
+
+    def _watch_lines(self, code):
+        code_events = self.local_events.get(code, 0) | self.events.LINE
+        self.local_events[code] = code_events
+        sys.monitoring.set_local_events(self.tool_id, code, code_events)
+
+    def _skip(self, code):
+        return (
+            self.dispatching
+            or threading.get_ident() != self.thread_id
+            or code.co_filename in self.internal_files
+        )
+
+    def _dispatch(self, event, arg):
+        frame = sys._getframe(2)
+        self.dispatching = True
+        try:
+            self.debugger.trace_dispatch(frame, event, arg)
+        finally:
+            self.dispatching = False
+        if self.debugger.quitting:
+            self.stop()
+
+    def _on_start(self, code, instruction_offset):
+        if self._skip(code):
+            return None
+        if self.mode == self.STEP or code in self.frame_codes:
+            self._dispatch("call", None)
+            return None
+        if self._has_breaks(code):
+            self._watch_lines(code)
+        return sys.monitoring.DISABLE
+
+    def _on_line(self, code, line_number):
+        if self._skip(code):
+            return None
+        if self.mode != self.STEP and code not in self.frame_codes:
+            breaks = self._get_breaks(code)
+            if not breaks:
+                return sys.monitoring.DISABLE
+            if (
+                line_number not in breaks
+                and code.co_firstlineno not in breaks
+            ):
+                return sys.monitoring.DISABLE
+        self._dispatch("line", None)
+        return None
+
+    def _on_return(self, code, instruction_offset, retval):
+        if self._skip(code):
+            return None
+        if self.mode == self.STEP or code in self.frame_codes:
+            self._dispatch("return", retval)
+        return None
+
+    def _on_unwind(self, code, instruction_offset, exception):
+        if self._skip(code):
+            return None
+        if self.mode == self.STEP or code in self.frame_codes:
+            self._dispatch("return", None)
+        return None
+
+    def _on_raise(self, code, instruction_offset, exception):
+        if self._skip(code):
+            return None
+        exc_info = (type(exception), exception, exception.__traceback__)
+        self._dispatch("exception", exc_info)
+        return None
+
+
+class LogSink(object):
+    """Logpoint records: A ring buffer (for the "logs" command), plus a
+    queue that a background thread writes out in batches."""
+
+    def __init__(self, size, interval, filename=None):
+        self.records = deque(maxlen=size)
+        self.pending = deque(maxlen=size)
+        self.interval = interval
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.thread = None
+        self.dropped = 0  # Not written out because the writer fell behind
+
+    def add(self, record):
+        # deque.append() is atomic, so hits don't need the lock.
+        self.records.append(record)
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(record)
+        if self.thread is None:
+            self.start()
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(
+                target=self._run, name="pdbp-logpoints", daemon=True
+            )
+            self.thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def flush(self):
+        with self.lock:
+            lines = []
+            while self.pending:
+                lines.append(self.format(self.pending.popleft()))
+            if self.dropped:
+                lines.append("[%d logpoint records dropped]" % self.dropped)
+                self.dropped = 0
+            if not lines:
+                return
+            text = "\n".join(lines) + "\n"
+            if self.filename:
+                filename = os.path.expanduser(self.filename)
+                with open(filename, "a", encoding="utf-8") as f:
+                    f.write(text)
+            else:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+
+    @staticmethod
+    def format(record):
+        timestamp, number, filename, lineno, exprs, values = record
+        stamp = time.strftime("%H:%M:%S", time.localtime(timestamp))
+        stamp += ".%06d" % ((timestamp % 1) * 1000000)
+        pairs = ", ".join(
+            "%s=%s" % (expr, value) for expr, value in zip(exprs, values)
+        )
+        return "[%s] #%d %s:%d %s" % (
+            stamp, number, os.path.basename(filename), lineno, pairs
+        )
+
+
+log_sink = None
+logpoint_repr = reprlib.Repr()
+logpoint_repr.maxstring = 120
+logpoint_repr.maxother = 120
+
+
+class LogPoint(bdb.Breakpoint):
+    """A breakpoint that records the values of expressions, and never stops.
+    (The expressions are compiled once, when the logpoint is set.)"""
+
+    def __init__(self, file, line, exprs, sink):
+        super().__init__(file, line)
+        self.exprs = tuple(exprs)
+        self.codes = [
+            compile(expr, "<logpoint>", "eval") for expr in self.exprs
+        ]
+        self.sink = sink
+
+    def log(self, frame):
+        f_globals = frame.f_globals
+        f_locals = frame.f_locals
+        values = []
+        for co in self.codes:
+            try:
+                value = logpoint_repr.repr(eval(co, f_globals, f_locals))
+            except Exception as e:
+                value = "<%s: %s>" % (type(e).__name__, e)
+            values.append(value)
+        self.sink.add(
+            (time.time(), self.number, self.file, self.line,
+             self.exprs, values)
+        )
+
+    def bpformat(self):
+        if self.enabled:
+            disp = "keep yes  "
+        else:
+            disp = "keep no   "
+        ret = "%-4dlogpoint     %s at %s:%d" % (
+            self.number, disp, self.file, self.line
+        )
+        ret += "\n\tlog %s" % ", ".join(self.exprs)
+        if self.cond:
+            ret += "\n\tlog only if %s" % (self.cond,)
+        if self.ignore:
+            ret += "\n\tignore next %d hits" % (self.ignore,)
+        if self.hits:
+            ret += "\n\tlogpoint already hit %d time%s" % (
+                self.hits, "s" if self.hits > 1 else ""
+            )
+        return ret
+
+
+condition_codes = {}  # condition --> code object (or the condition)
+
+
+def get_condition_code(cond):
+    """Compile a breakpoint condition once, instead of on every hit."""
+    try:
+        return condition_codes[cond]
+    except KeyError:
+        pass
+    try:
+        co = compile(cond, "<condition>", "eval")
+    except (SyntaxError, ValueError):
+        co = cond  # eval() will raise the error on the hit instead.
+    condition_codes[cond] = co
+    return co
+
+
+class BreakpointStats(object):
+    """Counters for the "break" listing. (Hits are in Breakpoint.hits)"""
+    __slots__ = ("evals", "eval_time", "fired")
+
+    def __init__(self):
+        self.evals = 0
+        self.eval_time = 0.0
+        self.fired = 0
+
+    @staticmethod
+    def get(bp):
+        stats = getattr(bp, "pdbp_stats", None)
+        if stats is None:
+            stats = bp.pdbp_stats = BreakpointStats()
+        return stats
+
+    def format(self):
+        ret = ""
+        if self.evals:
+            ret += "\n\tcondition evaluated %d time%s (%.3f ms total)" % (
+                self.evals, "s" if self.evals > 1 else "",
+                self.eval_time * 1000,
+            )
+        if self.fired:
+            ret += "\n\tfired %d time%s" % (
+                self.fired, "s" if self.fired > 1 else ""
+            )
+        return ret
+
+
+def effective(file, line, frame):
+    """Like bdb.effective(), but logpoints are logged instead of stopped at,
+    conditions are precompiled, and BreakpointStats are kept.
+    Return (active breakpoint, ok to delete if temporary) or (None, None)."""
+    possibles = bdb.Breakpoint.bplist[file, line]
+    for b in possibles:
+        if b.cond or isinstance(b, LogPoint):
+            break
+    else:
+        # Nothing to compile, time or log: the stock function does it.
+        (b, flag) = bdb.effective(file, line, frame)
+        if b is not None:
+            BreakpointStats.get(b).fired += 1
+        return (b, flag)
+    for b in possibles:
+        if not b.enabled:
+            continue
+        if not bdb.checkfuncname(b, frame):
+            continue
+        # Count every hit when bp is enabled
+        b.hits += 1
+        stats = BreakpointStats.get(b)
+        if b.cond:
+            # The ignore count only applies to hits where the cond is True.
+            co = get_condition_code(b.cond)
+            start = time.perf_counter()
+            try:
+                val = eval(co, frame.f_globals, frame.f_locals)
+            except Exception:
+                if isinstance(b, LogPoint):
+                    continue
+                # Stop regardless of the ignore count, and don't delete a
+                # temporary breakpoint (as another hint to the user).
+                stats.fired += 1
+                return (b, False)
+            finally:
+                stats.evals += 1
+                stats.eval_time += time.perf_counter() - start
+            if not val:
+                continue
+        if b.ignore > 0:
+            b.ignore -= 1
+            continue
+        stats.fired += 1
+        if isinstance(b, LogPoint):
+            b.log(frame)
+            continue
+        return (b, True)
+    return (None, None)
+
+
+def format_size(nbytes):
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if nbytes < 1024 or unit == "GB":
+            break
+        nbytes /= 1024.0
+    if unit == "bytes":
+        return "%d %s" % (nbytes, unit)
+    return "%.1f %s" % (nbytes, unit)
+
+
+def format_stat(value):
+    if isinstance(value, float) or type(value).__name__.startswith("float"):
+        return "%.6g" % value
+    return str(value)
+
+
+def get_sample_step(n_elements, max_elements):
+    """Step for an evenly spaced sample, with ~max_elements."""
+    if not max_elements or n_elements <= max_elements:
+        return 1
+    return int(math.ceil(n_elements / float(max_elements)))
+
+
+def ordinal(n):
+    if 10 <= n % 100 <= 20:
+        return "%dth" % n
+    return "%d%s" % (n, {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th"))
+
+
+def summarize_ndarray(arr, max_elements, np):
+    data = OrderedDict()
+    data["Shape"] = arr.shape
+    data["Dtype"] = str(arr.dtype)
+    data["Memory"] = format_size(arr.nbytes)
+    if not arr.size:
+        return data
+    sample = arr
+    if arr.ndim:
+        step = get_sample_step(arr.size, max_elements)
+        if step > 1:
+            # Over all axes, so that wide arrays are sampled too.
+            # (flat only copies the sampled elements)
+            sample = arr.flat[::step]
+            data["Sample"] = "Every %s element (%d of %d elements)" % (
+                ordinal(step), sample.size, arr.size
+            )
+    kind = arr.dtype.kind
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if kind in "fc":
+            data["Nulls"] = int(np.isnan(sample).sum())
+        elif kind in "mM":
+            isnat = np.isnat(sample)
+            data["Nulls"] = int(isnat.sum())
+            sample = sample[~isnat]
+        elif kind == "O":
+            data["Nulls"] = int(np.equal(sample, None).sum())
+        if kind in "biufmM" and sample.size:
+            if kind in "mM":
+                data["Min"] = sample.min()
+                data["Max"] = sample.max()
+            else:
+                data["Min"] = format_stat(np.nanmin(sample))
+                data["Max"] = format_stat(np.nanmax(sample))
+                data["Mean"] = format_stat(np.nanmean(sample))
+    return data
+
+
+def summarize_pandas(obj, max_elements, pd, max_columns=20):
+    data = OrderedDict()
+    is_frame = isinstance(obj, pd.DataFrame)
+    data["Shape"] = obj.shape
+    if is_frame:
+        counts = obj.dtypes.astype(str).value_counts()
+        data["Dtypes"] = ", ".join(
+            "%s(%d)" % (dtype, count) for dtype, count in counts.items()
+        )
+    else:
+        data["Dtype"] = str(obj.dtype)
+    nbytes = obj.memory_usage(deep=False)
+    if hasattr(nbytes, "sum"):
+        nbytes = nbytes.sum()
+    data["Memory"] = format_size(int(nbytes))
+    if not obj.size:
+        return data
+    n_columns = obj.shape[1] if is_frame else 1
+    if n_columns > max_columns:
+        obj = obj.iloc[:, :max_columns]  # Only these columns are shown
+    step = get_sample_step(obj.size, max_elements)
+    sample = obj.iloc[::step]
+    if step > 1:
+        data["Sample"] = "Every %s row (%d of %d rows)" % (
+            ordinal(step), len(sample), len(obj)
+        )
+    frame = sample if is_frame else sample.to_frame()
+    lines = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for i in range(frame.shape[1]):
+            column = frame.iloc[:, i]
+            line = "  %-20s %-10s nulls=%d" % (
+                str(frame.columns[i])[:20],
+                column.dtype,
+                int(column.isna().sum()),
+            )
+            if (
+                pd.api.types.is_numeric_dtype(column.dtype)
+                and not pd.api.types.is_bool_dtype(column.dtype)
+            ):
+                line += "  min=%s  max=%s  mean=%s" % (
+                    format_stat(column.min()),
+                    format_stat(column.max()),
+                    format_stat(column.mean()),
+                )
+            lines.append(line)
+    if n_columns > max_columns:
+        lines.append("  … (%d more columns)" % (n_columns - max_columns))
+    data["Columns"] = "\n" + "\n".join(lines)
+    return data
+
+
+def summarize_data(obj, max_elements):
+    """Shape, dtype, memory, nulls, and min/max/mean of numpy arrays, pandas
+    objects, and other buffers (Eg: array.array). None for other objects.
+    Reductions are vectorized, and run on an evenly spaced sample (of the
+    elements of arrays, or of the rows of pandas objects) when there are
+    more than max_elements elements."""
+    np = sys.modules.get("numpy")
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(obj, (pd.DataFrame, pd.Series)):
+        return summarize_pandas(obj, max_elements, pd)
+    if np is not None and isinstance(obj, np.ndarray):
+        return summarize_ndarray(obj, max_elements, np)
+    if isinstance(obj, (str, bytes, bytearray)):
+        return None
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return None
+    if np is not None and view.format not in ("", "c"):
+        try:
+            return summarize_ndarray(np.asarray(view), max_elements, np)
+        except Exception:
+            pass
+    data = OrderedDict()
+    data["Shape"] = view.shape
+    data["Dtype"] = "%r (%d bytes per item)" % (view.format, view.itemsize)
+    data["Memory"] = format_size(view.nbytes)
+    return data
+
+
+class DeepSize(object):
+    """Deep sizes for the "mem" command: sys.getsizeof() of an object and of
+    everything it references, except for modules, classes, functions, and
+    frames (which are shared, rather than owned). The traversal is iterative
+    and stops at max_objects visited objects or after time_limit seconds.
+    Tuples and frozensets made only of immutable objects can't change, so
+    their sizes are reused on later stops. (Entries are keyed by id, and
+    hold no reference to the object: its type, length and hash must match)
+    """
+    skip_types = frozenset([
+        types.ModuleType,
+        type,
+        types.FunctionType,
+        types.BuiltinFunctionType,
+        types.MethodType,
+        types.FrameType,
+        types.CodeType,
+    ])  # Exact types. (Classes with a metaclass are skipped separately)
+    immutable_types = frozenset([
+        tuple, frozenset, str, bytes, int, float, complex, bool, type(None),
+        range,
+    ])
+    cached_types = (tuple, frozenset)
+
+    def __init__(self, max_objects=1000000, time_limit=2.0, cache_size=256):
+        self.max_objects = max_objects
+        self.time_limit = time_limit
+        self.cache = LRUCache(cache_size)  # id --> (guard, size, count)
+
+    @staticmethod
+    def get_guard(obj):
+        """What a cached entry must match. (A new object that gets the id
+        of a dead one would also need the same type, length and hash)"""
+        try:
+            return type(obj), len(obj), hash(obj)
+        except Exception:
+            return None
+
+    def get_cached(self, obj):
+        if type(obj) not in self.cached_types:
+            return None
+        entry = self.cache.get(id(obj))
+        if entry is None:
+            return None
+        if entry[0] != self.get_guard(obj):
+            del self.cache[id(obj)]
+            return None
+        return entry[1], entry[2]
+
+    def measure(self, objs, exclude=(), recount=False):
+        """Return a (size, count, complete, reused) tuple for each of objs.
+        Each object first gets an equal share of the budget. Then whatever
+        is left is used to continue the traversals that didn't finish.
+        Objects in exclude (Eg: the debugger) are never traversed."""
+        exclude = set(map(id, exclude))
+        results = [None] * len(objs)
+        walks = []
+        for i, obj in enumerate(objs):
+            cached = None if recount else self.get_cached(obj)
+            if id(obj) in exclude:
+                results[i] = (0, 0, True, False)
+            elif cached is not None:
+                results[i] = cached + (True, True)
+            else:
+                seen = set(exclude)
+                seen.add(id(obj))
+                walks.append([i, obj, seen, [obj], 0, 0, True])
+        remaining = self.max_objects or float("inf")
+        deadline = time.perf_counter() + (self.time_limit or 1e9)
+        for _ in range(2):
+            for n, walk in enumerate(walks):
+                if results[walk[0]] is not None:
+                    continue
+                if remaining <= 0:
+                    break
+                share = max(remaining // (len(walks) - n), 1)
+                now = time.perf_counter()
+                stop = now + max(deadline - now, 0.0) / (len(walks) - n)
+                remaining -= self._walk(walk, share, stop)
+                if not walk[3]:
+                    results[walk[0]] = self._finish(walk)
+            walks = [w for w in walks if results[w[0]] is None]
+        for walk in walks:
+            results[walk[0]] = (walk[4], walk[5], False, False)
+        return results
+
+    def _finish(self, walk):
+        _, obj, _, _, size, count, immutable = walk
+        if immutable and type(obj) in self.cached_types:
+            guard = self.get_guard(obj)
+            if guard is not None:
+                self.cache.put(id(obj), (guard, size, count))
+        return size, count, True, False
+
+    def _walk(self, walk, max_count, deadline):
+        """Continue a traversal, for up to max_count objects or until the
+        deadline. Return the number of objects that were visited."""
+        _, _, seen, stack, size, count, immutable = walk
+        getsizeof = sys.getsizeof
+        get_referents = gc.get_referents
+        skip_types = self.skip_types
+        immutable_types = self.immutable_types
+        start_count = count
+        max_count += count
+        while stack:
+            if count >= max_count or (
+                count & 1023 == 0 and time.perf_counter() > deadline
+            ):
+                break
+            o = stack.pop()
+            count += 1
+            if immutable and type(o) not in immutable_types:
+                immutable = False
+            try:
+                size += getsizeof(o, 0)
+            except Exception:
+                pass
+            for child in get_referents(o):
+                i = id(child)
+                if i not in seen:
+                    seen.add(i)
+                    if not (
+                        type(child) in skip_types or isinstance(child, type)
+                    ):
+                        stack.append(child)
+        walk[4] = size
+        walk[5] = count
+        walk[6] = immutable
+        return count - start_count
+
+
+refs_repr = reprlib.Repr()
+refs_repr.maxlevel = 1
+refs_repr.maxstring = 60
+refs_repr.maxother = 60
+
+
+class RefGraph(object):
+    """Breadth-first walks of the gc graph, for "refs" and "referrers".
+    Walks stop at max_depth levels or at max_objects objects, and never go
+    through ignored objects (Eg: the debugger and its dicts) or through the
+    frames of the debugger. Paths go from a root (a module's globals, or a
+    frame of the program) down to the target."""
+    internal_files = MonitoringBackend.internal_files | {pdb.cmd.__file__}
+    skip_types = DeepSize.skip_types
+    sequence_types = (list, tuple, deque)
+    namespace_holders = (dict, list, tuple, set, frozenset, types.FrameType)
+
+    def __init__(self, max_depth=8, max_objects=100000, ignore=(), frames=()):
+        """frames is a list of (frame, locals) of the program."""
+        self.max_depth = max(max_depth, 1)
+        self.max_objects = max_objects
+        self.ignore = set(map(id, ignore))
+        self.frames = []
+        self.frame_locals = {}  # id(frame) --> locals of the frame
+        for frame, f_locals in frames:
+            if not self.is_internal(frame):
+                self.frames.append(frame)
+                self.frame_locals[id(frame)] = f_locals
+                self.ignore.add(id(f_locals))
+        self.module_dicts = {}  # id(module.__dict__) --> module name
+        for name, module in list(sys.modules.items()):
+            if isinstance(module, types.ModuleType):
+                self.module_dicts[id(module.__dict__)] = name
+        self.truncated = False
+
+    def is_internal(self, obj):
+        return (
+            isinstance(obj, types.FrameType)
+            and obj.f_code.co_filename in self.internal_files
+        )
+
+    def get_label(self, parent, child):
+        """How parent refers to child, as text. (Eg: "[0]", "['k']", ".x")
+        Attributes are found without running any code of the program."""
+        if isinstance(parent, dict):
+            for key, value in dict.items(parent):
+                if value is child:
+                    return "[%s]" % refs_repr.repr(key)
+                if key is child:
+                    return ".keys()"
+        elif isinstance(parent, self.sequence_types):
+            for i, value in enumerate(parent):
+                if value is child:
+                    return "[%d]" % i
+        elif isinstance(parent, (set, frozenset)):
+            return "{}"
+        elif isinstance(parent, types.FrameType):
+            f_locals = self.frame_locals.get(id(parent))
+            if f_locals is None:
+                f_locals = parent.f_locals
+            for name, value in list(f_locals.items()):
+                if value is child:
+                    return ":%s" % name
+        elif isinstance(parent, types.CellType):
+            return ".cell_contents"
+        try:
+            namespace = object.__getattribute__(parent, "__dict__")
+        except Exception:
+            namespace = {}
+        if namespace is child:
+            return ".__dict__"
+        for name, value in namespace.items():
+            if value is child:
+                return ".%s" % name
+        for cls in type(parent).__mro__:
+            for name, attr in vars(cls).items():
+                if not isinstance(attr, (
+                    types.MemberDescriptorType, types.GetSetDescriptorType
+                )) or name == "__dict__":
+                    continue
+                try:
+                    if attr.__get__(parent, type(parent)) is child:
+                        return ".%s" % name
+                except Exception:
+                    pass
+        if isinstance(child, dict) and not isinstance(
+            parent, self.namespace_holders
+        ):
+            return ".__dict__"  # Eg: A class refers to its dict, not a proxy
+        return " -> <%s>" % type(child).__name__
+
+    def format_path(self, path):
+        """Like "module.obj.attr['key'][0]", for a path from a root."""
+        root = path[0]
+        namespace = False
+        if isinstance(root, types.FrameType):
+            text = "%s()" % root.f_code.co_name
+        else:
+            text = self.module_dicts[id(root)]
+            namespace = True
+        for parent, child in zip(path, path[1:]):
+            label = self.get_label(parent, child)
+            if label == ".__dict__":
+                namespace = True
+                continue
+            name = label[2:-2]
+            if namespace and label[:2] == "['" and name.isidentifier():
+                label = "." + name
+            namespace = False
+            text += label
+        return text
+
+    def find_paths(self, target, max_paths):
+        """Shortest paths from roots to target. There's one gc scan (with
+        gc.get_referrers) per level, for all the objects of that level."""
+        self.truncated = False
+        ignore = self.ignore
+        hops = {id(target): None}  # id(obj) --> next obj toward target
+        roots = []  # Roots, with the first hops from them in root_hops
+        root_hops = []
+        root_edges = set()
+        frontier = [target]
+        ignore.update((id(hops), id(roots), id(root_hops)))
+        for depth in range(self.max_depth):
+            if not frontier or len(roots) >= max_paths:
+                break
+            ids = set(map(id, frontier))
+            for frame in self.frames:
+                for value in list(self.frame_locals[id(frame)].values()):
+                    if id(value) in ids and (
+                        (id(frame), id(value)) not in root_edges
+                    ):
+                        root_edges.add((id(frame), id(value)))
+                        roots.append(frame)
+                        root_hops.append(value)
+            args = tuple(frontier)
+            referrers = gc.get_referrers(*args)
+            ignore.update((id(frontier), id(args), id(referrers)))
+            frontier = []
+            for r in referrers:
+                rid = id(r)
+                if rid in hops or rid in ignore or self.is_internal(r):
+                    continue
+                for child in gc.get_referents(r):
+                    if id(child) in ids:
+                        break
+                else:
+                    continue
+                if rid in self.module_dicts or isinstance(
+                    r, types.FrameType
+                ):
+                    # Roots are kept apart from hops, so that there can be
+                    # more than one path from the same module or frame.
+                    if (rid, id(child)) not in root_edges:
+                        root_edges.add((rid, id(child)))
+                        roots.append(r)
+                        root_hops.append(child)
+                    continue
+                hops[rid] = child
+                if type(r) not in self.skip_types:
+                    frontier.append(r)
+                if len(hops) >= self.max_objects:
+                    self.truncated = True
+                    break
+            if self.truncated:
+                break
+        if frontier and len(roots) < max_paths:
+            self.truncated = True
+        paths = []
+        for root, child in list(zip(roots, root_hops))[:max_paths]:
+            path = [root, child]
+            while path[-1] is not target:
+                path.append(hops[id(path[-1])])
+            paths.append(path)
+        return paths
+
+    def iter_referents(self, obj, max_depth, max_lines):
+        """Yield (depth, label, obj) for what obj refers to, in tree order.
+        The tree is built breadth-first, so each object is listed where it
+        is nearest to obj. (Classes of instances are left out)"""
+        self.truncated = False
+        seen = set(self.ignore)
+        seen.add(id(obj))
+        children = {}  # id(obj) --> [child, ...]
+        frontier = [obj]
+        for depth in range(max_depth):
+            next_frontier = []
+            for parent in frontier:
+                if depth and (
+                    type(parent) in self.skip_types
+                    or isinstance(parent, type)
+                    or id(parent) in self.module_dicts
+                ):
+                    continue
+                kids = children[id(parent)] = []
+                for child in gc.get_referents(parent):
+                    if id(child) in seen or child is type(parent):
+                        continue
+                    seen.add(id(child))
+                    kids.append(child)
+                    next_frontier.append(child)
+                    if len(seen) >= self.max_objects:
+                        self.truncated = True
+                        break
+                if isinstance(parent, (list, tuple)):
+                    kids.reverse()  # (They are traversed from the end)
+                if self.truncated:
+                    break
+            frontier = next_frontier
+            if self.truncated:
+                break
+        stack = [(0, "", obj)]
+        n_lines = 0
+        while stack:
+            depth, label, node = stack.pop()
+            if n_lines >= max_lines:
+                self.truncated = True
+                return
+            n_lines += 1
+            yield depth, label, node
+            kids = children.get(id(node), ())
+            for child in reversed(kids):
+                stack.append(
+                    (depth + 1, self.get_label(node, child), child)
+                )
+
+
+class DebuggerTraceFilter(object):
+    """A tracemalloc filter (see Snapshot.filter_traces) that drops the
+    traces with a frame of the debugger anywhere in their traceback. The
+    frames that run the program (Eg: for "python -m pdbp") are below all
+    of its frames, so their lines don't count."""
+    inclusive = False
+
+    def __init__(self, files, launcher_lines):
+        self.files = files
+        self.launcher_lines = launcher_lines  # {(filename, lineno)}
+        self.kept = {}  # traceback --> True if it's not the debugger's
+
+    def _match(self, trace):
+        traceback = trace[2]  # ((filename, lineno), ...)
+        keep = self.kept.get(traceback)
+        if keep is None:
+            keep = self.kept[traceback] = not any(
+                frame[0] in self.files and frame not in self.launcher_lines
+                for frame in traceback
+            )
+        return keep
+
+
+class MallocTracker(object):
+    """tracemalloc snapshots for the "malloc" command. While active, a
+    snapshot is taken at every stop, so that "malloc diff" shows what was
+    allocated (and not freed yet) since the previous stop. Allocations
+    with a frame of the debugger in their traceback are filtered out. (So
+    tracing keeps filter_frames frames by default, to reach that frame.)"""
+    filter_frames = 16
+
+    def __init__(self):
+        self.active = False
+        self.started = False  # True if tracemalloc was started by "malloc"
+        self.snapshot = None
+        self.previous = None
+        self.filter = None
+
+    def get_filter(self):
+        files = set(RefGraph.internal_files)
+        pdbp_lazy = sys.modules.get("pdbp_lazy")
+        if getattr(pdbp_lazy, "__file__", None):
+            files.add(pdbp_lazy.__file__)
+        frames = []
+        frame = sys._getframe()
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        launcher_lines = set()
+        for frame in reversed(frames):  # From the oldest one
+            filename = frame.f_code.co_filename
+            if filename in files:
+                launcher_lines.add((filename, frame.f_lineno))
+            elif frame.f_globals.get("__name__") != "runpy":
+                break  # A frame of the program
+        return DebuggerTraceFilter(frozenset(files), launcher_lines)
+
+    def start(self, nframes=None):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(nframes or self.filter_frames)
+            self.started = True
+        self.active = True
+        self.snapshot = self.previous = None
+        self.take()
+
+    def stop(self):
+        import tracemalloc
+        if self.started:
+            tracemalloc.stop()
+        self.active = self.started = False
+        self.snapshot = self.previous = None
+
+    def take(self):
+        """Take the snapshot of this stop. (The last one becomes previous)"""
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            self.active = False
+            return
+        self.filter = self.get_filter()
+        self.previous = self.snapshot
+        self.snapshot = tracemalloc.take_snapshot().filter_traces(
+            [self.filter]
+        )
+
+
+class SamplingProfiler(object):
+    """A sampling profiler for the "profile" command. A helper thread reads
+    the stack of one thread with sys._current_frames(), every interval
+    seconds, and counts identical stacks. The GIL is only held while a
+    stack is read, so the program runs at (nearly) full speed.
+    on_timeout() is called from the helper thread when time is up."""
+
+    def __init__(self, thread_id, seconds, interval, on_timeout):
+        self.thread_id = thread_id
+        self.seconds = seconds
+        self.interval = interval
+        self.on_timeout = on_timeout
+        self.stacks = {}  # ((filename, lineno, name), ...) --> samples
+        self.samples = 0
+        self.elapsed = 0.0
+        self.expired = False
+        self.done = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self.run, name="pdbp-profile", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling. (Called at the stop that ends the profile)"""
+        with self.lock:
+            self.done = True
+        self.thread.join(1.0)
+
+    def run(self):
+        internal_files = RefGraph.internal_files
+        current_frames = sys._current_frames
+        stacks = self.stacks
+        start = time.perf_counter()
+        deadline = start + self.seconds
+        next_sample = start + self.interval
+        time.sleep(self.interval)  # (Let the debugger return to the program)
+        while not self.done:
+            if time.perf_counter() >= deadline:
+                break
+            frame = current_frames().get(self.thread_id)
+            if frame is None:
+                self.done = True  # The thread is gone
+                break
+            stack = []  # Innermost frame first
+            while frame is not None:
+                co = frame.f_code
+                if co.co_filename not in internal_files:
+                    stack.append((co.co_filename, frame.f_lineno, co.co_name))
+                frame = frame.f_back
+            key = tuple(stack)
+            stacks[key] = stacks.get(key, 0) + 1
+            self.samples += 1
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.perf_counter()  # Fell behind
+        self.elapsed = time.perf_counter() - start
+        with self.lock:
+            if self.done:
+                return
+            self.expired = True
+        self.on_timeout()
+
+    def iter_report(self, count):
+        """Yield the lines of the hot functions and hot lines tables."""
+        import linecache
+        total = self.samples
+        yield "%d samples in %.2f s (every %.1f ms)" % (
+            total, self.elapsed, self.interval * 1000
+        )
+        if not total:
+            return
+        functions = {}  # (filename, name) --> [total samples, self samples]
+        lines = {}  # (filename, lineno) --> self samples
+        for stack, n in self.stacks.items():
+            if not stack:
+                continue
+            for key in set((f, name) for f, _, name in stack):
+                functions.setdefault(key, [0, 0])[0] += n
+            filename, lineno, name = stack[0]
+            functions[filename, name][1] += n
+            lines[filename, lineno] = lines.get((filename, lineno), 0) + n
+        yield "Hot functions:"
+        yield "%8s %7s  %s" % ("Total", "Self", "Function")
+        for (filename, name), (n_total, n_self) in sorted(
+            functions.items(), key=lambda item: (-item[1][1], -item[1][0])
+        )[:count]:
+            yield "%7.1f%% %6.1f%%  %s (%s)" % (
+                100.0 * n_total / total, 100.0 * n_self / total,
+                name, filename,
+            )
+        yield "Hot lines:"
+        yield "%8s  %s" % ("Self", "Line")
+        for (filename, lineno), n in sorted(
+            lines.items(), key=lambda item: -item[1]
+        )[:count]:
+            yield "%7.1f%%  %s:%d  %s" % (
+                100.0 * n / total, filename, lineno,
+                linecache.getline(filename, lineno).strip()[:60],
+            )
+
+    def write_collapsed(self, path):
+        """Write the stacks in the "collapsed" format of flamegraph.pl.
+        (speedscope and most flame graph tools can read it too)"""
+        with open(path, "w") as f:
+            for stack, n in sorted(self.stacks.items()):
+                frames = ";".join(
+                    "%s (%s:%d)" % (name, filename, lineno)
+                    for filename, lineno, name in reversed(stack)
+                )
+                f.write("%s %d\n" % (frames or "<idle>", n))
+
+
+class ThreadRegistry(object):
+    """The debugger sessions of threads (one Pdb per thread), and the
+    terminal that they share. Threads that stop wait for the prompt in
+    order of arrival. The thread at the prompt can hand it to another
+    stopped thread ("thread N"), and then waits for its next turn."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.sessions = {}  # thread id --> (thread, Pdb)
+        self.numbers = {}  # thread id --> number, for "threads"/"thread N"
+        self.next_number = 1
+        self.owner = None  # The thread id at the prompt
+        self.depth = 0  # Nested interactions of the owner (Eg: "debug")
+        self.waiting = deque()  # Stopped thread ids, waiting for the prompt
+        self.preferred = None  # The next owner, picked with "thread N"
+        self.last_owner = None
+
+    def get(self, ident=None):
+        """Return the Pdb of a thread (Default: this thread), or None."""
+        if ident is None:
+            ident = threading.get_ident()
+        thread, pdb = self.sessions.get(ident, (None, None))
+        if thread is not None and ident == threading.get_ident() and (
+            thread is not threading.current_thread()
+        ):
+            return None  # A dead thread had the same id
+        return pdb
+
+    def register(self, pdb):
+        with self.cond:
+            alive = set(t.ident for t in threading.enumerate())
+            for ident in list(self.sessions):
+                if ident not in alive:
+                    del self.sessions[ident]
+            ident = threading.get_ident()
+            self.sessions[ident] = (threading.current_thread(), pdb)
+            self.get_number(ident)
+
+    def get_number(self, ident):
+        number = self.numbers.get(ident)
+        if number is None:
+            number = self.numbers[ident] = self.next_number
+            self.next_number += 1
+        return number
+
+    def clear(self):
+        with self.cond:
+            self.sessions.clear()
+
+    def acquire(self):
+        """Wait for the prompt. (Nested calls of its owner don't wait)
+        Return True if another thread had the prompt before."""
+        ident = threading.get_ident()
+        with self.cond:
+            if self.owner == ident:
+                self.depth += 1
+                return False
+            self.waiting.append(ident)
+            switched = self._wait_for_turn(ident)
+            self.depth = 1
+            return switched
+
+    def release(self):
+        with self.cond:
+            self.depth -= 1
+            if self.depth <= 0:
+                self.owner = None
+                self.cond.notify_all()
+
+    def handoff(self, target):
+        """Give the prompt to target (a waiting thread id), and wait for
+        the prompt again, first in line."""
+        ident = threading.get_ident()
+        with self.cond:
+            depth = self.depth
+            self.owner = None
+            self.preferred = target
+            self.waiting.appendleft(ident)
+            self.cond.notify_all()
+            self._wait_for_turn(ident)
+            self.depth = depth
+            return True
+
+    def _wait_for_turn(self, ident):
+        while not (self.owner is None and (
+            self.preferred == ident
+            or self.preferred not in self.waiting and self.waiting[0] == ident
+        )):
+            try:
+                self.cond.wait()
+            except KeyboardInterrupt:
+                pass  # A Ctrl-C at the prompt of another thread
+        self.waiting.remove(ident)
+        if self.preferred == ident:
+            self.preferred = None
+        self.owner = ident
+        switched = self.last_owner not in (None, ident)
+        self.last_owner = ident
+        return switched
+
+    def get_state(self, ident):
+        if ident == self.owner:
+            return "prompt"
+        if ident in self.waiting:
+            return "stopped"
+        return "running"
+
+
+thread_registry = ThreadRegistry()
+
+
+def group_thread_stacks(frames, skip_files):
+    """Group the threads of sys._current_frames() that have identical
+    stacks. Return (thread ids, stack) pairs, the biggest group first.
+    A stack is a list of (frame, lineno), innermost first. Frames from
+    skip_files, and the frames that they called, are left out."""
+    groups = {}
+    for ident, frame in frames.items():
+        stack = []
+        while frame is not None:
+            if frame.f_code.co_filename in skip_files:
+                del stack[:]  # Called by the debugger
+            else:
+                stack.append((frame, frame.f_lineno))
+            frame = frame.f_back
+        if stack:
+            key = tuple((f.f_code, lineno) for f, lineno in stack)
+            groups.setdefault(key, ([], stack))[0].append(ident)
+    return sorted(groups.values(), key=lambda group: -len(group[0]))
+
+
+def get_running_loop():
+    """Return the asyncio event loop running in this thread, or None.
+    (asyncio doesn't get imported for programs that don't use it.)"""
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return None
+    return asyncio._get_running_loop()
+
+
+def run_coroutine(coro):
+    """Run coro in a new event loop of this thread, and return its result.
+    The loop that was running in this thread is paused by the debugger (and
+    can't run nested), so it's set aside until coro is done. (Awaiting its
+    futures raises an error: they are attached to a different loop.)"""
+    import asyncio
+    running_loop = asyncio._get_running_loop()
+    asyncio._set_running_loop(None)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+        asyncio._set_running_loop(running_loop)
+
+
+def format_duration(seconds):
+    if seconds < 0.001:
+        return "%dus" % (seconds * 1000000)
+    if seconds < 1:
+        return "%.1fms" % (seconds * 1000)
+    return "%.2fs" % seconds
+
+
+class LineStats(object):
+    """Hits and wall time per line of one code object, for "linestat".
+    A line's time lasts until the next line (or the return) of the same
+    frame, so it includes the calls made on that line. Python 3.12+ gets
+    sys.monitoring LINE events for that code object only. Older versions
+    count them in the dispatch_line() of the debugger (sys.settrace)."""
+    gutter_width = 17
+
+    def __init__(self, code):
+        self.code = code
+        self.hits = {}  # lineno --> hits
+        self.times = {}  # lineno --> seconds
+        self.last = {}  # id(frame) --> (lineno, time of the line event)
+        self.active = False
+        self.tool_id = None
+
+    def line(self, frame_id, lineno):
+        now = time.perf_counter()
+        last = self.last.get(frame_id)
+        if last is not None:
+            self.times[last[0]] = self.times.get(last[0], 0.0) + now - last[1]
+        self.hits[lineno] = self.hits.get(lineno, 0) + 1
+        self.last[frame_id] = (lineno, now)
+
+    def leave(self, frame_id):
+        last = self.last.pop(frame_id, None)
+        if last is not None:
+            self.times[last[0]] = (
+                self.times.get(last[0], 0.0) + time.perf_counter() - last[1]
+            )
+
+    def start(self):
+        """Count the lines of self.code."""
+        self.active = True
+        if not hasattr(sys, "monitoring"):
+            return  # Pdb.dispatch_line() counts them
+        monitoring = sys.monitoring
+        for tool_id in (monitoring.PROFILER_ID, 3, 4):
+            if monitoring.get_tool(tool_id) is None:
+                break
+        else:
+            raise RuntimeError("No free sys.monitoring tool id")
+        monitoring.use_tool_id(tool_id, "pdbp-linestat")
+        self.tool_id = tool_id
+        events = monitoring.events
+        callbacks = {
+            events.PY_START: self._on_start,
+            events.LINE: self._on_line,
+            events.PY_RETURN: self._on_leave,
+            events.PY_YIELD: self._on_leave,
+        }
+        for event, callback in callbacks.items():
+            monitoring.register_callback(tool_id, event, callback)
+        monitoring.set_local_events(tool_id, self.code, sum(callbacks))
+
+    def stop(self):
+        self.active = False
+        self.last.clear()
+        if self.tool_id is not None:
+            monitoring = sys.monitoring
+            monitoring.set_local_events(self.tool_id, self.code, 0)
+            for event in (
+                monitoring.events.PY_START, monitoring.events.LINE,
+                monitoring.events.PY_RETURN, monitoring.events.PY_YIELD,
+            ):
+                monitoring.register_callback(self.tool_id, event, None)
+            monitoring.free_tool_id(self.tool_id)
+            self.tool_id = None
+
+    def _on_start(self, code, offset):
+        self.last.pop(id(sys._getframe(1)), None)
+
+    def _on_line(self, code, lineno):
+        self.line(id(sys._getframe(1)), lineno)
+
+    def _on_leave(self, code, offset, retval):
+        self.leave(id(sys._getframe(1)))
+
+    def get_gutter(self, lineno, highlight=True):
+        """The "hits time" text for the left of a line, colored by heat."""
+        hits = self.hits.get(lineno)
+        if not hits:
+            return " " * self.gutter_width
+        seconds = self.times.get(lineno, 0.0)
+        text = "%7d %8s " % (hits, format_duration(seconds))
+        if highlight:
+            share = seconds / (sum(self.times.values()) or 1.0)
+            if share >= 0.25:
+                text = Color.set("31;1", text)  # Hot: Red
+            elif share >= 0.05:
+                text = Color.set("33;1", text)  # Warm: Yellow
+            else:
+                text = Color.set("90", text)  # Gray
+        return text
+
+    def iter_report(self):
+        import linecache
+        total = sum(self.times.values()) or 1.0
+        yield "%6s %9s %9s %6s  %s" % ("Line", "Hits", "Time", "%", "Source")
+        for lineno in sorted(self.hits):
+            seconds = self.times.get(lineno, 0.0)
+            yield "%6d %9d %9s %5.1f%%  %s" % (
+                lineno, self.hits[lineno], format_duration(seconds),
+                100.0 * seconds / total,
+                linecache.getline(self.code.co_filename, lineno).rstrip(),
+            )
+
+
+def get_socket_path(pid):
+    """The Unix socket of listen_on_signal(), for "pdbp attach <pid>"."""
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), "pdbp-%d.sock" % pid)
+
+
+def get_remote_address(address):
+    """Return the (family, address) of a socket path, or of a TCP port
+    (Eg: 4444, ":4444", "localhost:4444"). Ports default to 127.0.0.1."""
+    import socket
+    address = str(address)
+    if address.isdigit():
+        return socket.AF_INET, ("127.0.0.1", int(address))
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and not set("/\\") & set(address):
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    return socket.AF_UNIX, address
+
+
+def check_loopback_host(host):
+    """Raise ValueError if host is not only a loopback address."""
+    import ipaddress
+    import socket
+    try:
+        infos = socket.getaddrinfo(host, None, socket.AF_INET)
+    except socket.gaierror as e:
+        raise ValueError("Unknown host %r (%s)" % (host, e))
+    for info in infos:
+        if not ipaddress.ip_address(info[4][0]).is_loopback:
+            raise ValueError(
+                "%r is not a loopback host (see remote_any_host)" % host
+            )
+
+
+def bind_private(sock, path):
+    """Bind a Unix socket at path, with access for this user only from the
+    start. (A chmod after bind leaves a window for other users)"""
+    umask = os.umask(0o077)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(umask)
+
+
+class RemoteFile(object):
+    """The stdin and stdout of a remote session: a connected socket.
+    Output is buffered, and sent in one write when the debugger waits for
+    a command (or lets the program run). So frames arrive in one piece."""
+    max_buffer_size = 65536
+    encoding = "utf-8"
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile(
+            "r", encoding="utf-8", errors="replace", newline="\n"
+        )
+        self.buffer = []
+        self.buffer_size = 0
+        self.size = None  # The terminal of the client: (columns, lines)
+        self.closed = False
+        self.framed = False  # For a Broker: output and prompts in frames
+
+    def handshake(self, timeout):
+        """Read the terminal size, which "pdbp attach" sends first."""
+        import socket
+        self.sock.settimeout(timeout)
+        try:
+            data = self.sock.recv(256, socket.MSG_PEEK)
+        except (socket.timeout, OSError):
+            data = b""
+        finally:
+            self.sock.settimeout(None)
+        if data.startswith(b"pdbp attach ") and b"\n" in data:
+            line = self.reader.readline().split()
+            try:
+                self.size = os.terminal_size((int(line[2]), int(line[3])))
+            except (IndexError, ValueError):
+                pass
+
+    def isatty(self):
+        return self.size is not None
+
+    def write(self, data):
+        if self.closed:
+            return
+        self.buffer.append(data)
+        self.buffer_size += len(data)
+        if self.buffer_size > self.max_buffer_size:
+            self.send()
+
+    def flush(self):
+        pass  # Output is sent by send(), a whole frame at a time.
+
+    def send(self, prompt=False):
+        """Send the buffered output. (And a prompt frame, if framed)"""
+        data = "".join(self.buffer).encode("utf-8", "replace")
+        self.buffer = []
+        self.buffer_size = 0
+        if self.framed:
+            data = Broker.frame(Broker.output_frame, data) if data else b""
+            if prompt:
+                data += Broker.frame(Broker.prompt_frame)
+        if data and not self.closed:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                self.closed = True
+
+    def readline(self):
+        self.send(prompt=True)
+        if self.closed:
+            return ""
+        try:
+            line = self.reader.readline()
+        except OSError:
+            line = ""
+        if not line:
+            self.closed = True
+        return line
+
+    def close(self):
+        self.send()
+        self.closed = True
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
 
-    def before_interaction_hook(self, pdb):
-        pass
+def accept_remote(address, timeout):
+    """Listen on a Unix socket or a TCP port (see get_remote_address) until
+    a client connects, and return its RemoteFile. (None after timeout.)
+    Unix sockets are only for this user. A TCP port is open to all users
+    of this host, so prefer paths (or SSH tunnels to a path). Hosts other
+    than loopback ones need remote_any_host."""
+    import socket
+    import stat
+    family, address = get_remote_address(address)
+    if family != socket.AF_UNIX and not DefaultConfig.remote_any_host:
+        check_loopback_host(address[0])
+    server = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        if family == socket.AF_UNIX:
+            if os.path.exists(address) and stat.S_ISSOCK(
+                os.stat(address).st_mode
+            ):
+                os.unlink(address)  # Left by an earlier process
+            bind_private(server, address)
+        else:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind(address)
+        server.listen(1)
+        server.settimeout(timeout)
+        if family != socket.AF_UNIX:
+            address = "%s:%d" % address
+        print(
+            "pdbp: Waiting for a client (python -m pdbp attach %s)"
+            % address,
+            file=sys.stderr,
+        )
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            print("pdbp: No client, so no debugging.", file=sys.stderr)
+            return None
+    finally:
+        server.close()
+        if family == socket.AF_UNIX:
+            try:
+                os.unlink(address)
+            except OSError:
+                pass
+    conn.settimeout(None)
+    remote = RemoteFile(conn)
+    remote.handshake(1.0)
+    return remote
 
 
-def setbgcolor(line, color):
-    # Add a bgcolor attribute to all escape sequences found.
-    setbg = "\x1b[%sm" % color
-    regexbg = "\\1;%sm" % color
-    result = setbg + re.sub("(\x1b\\[.*?)m", regexbg, line) + "\x1b[00m"
-    if os.environ.get("TERM") == "eterm-color":
-        result = result.replace(setbg, "\x1b[37;%dm" % color)
-        result = result.replace("\x1b[00;%dm" % color, "\x1b[37;%dm" % color)
-        result = result.replace("\x1b[39;49;00;", "\x1b[37;")
-    return result
+def connect_broker(path):
+    """Connect to the Broker at path (Eg: $PDBP_BROKER), and return the
+    RemoteFile of a session, or None if the broker isn't there."""
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    label = os.environ.get("PYTEST_XDIST_WORKER")
+    multiprocessing = sys.modules.get("multiprocessing")
+    if not label and multiprocessing is not None:
+        label = multiprocessing.current_process().name
+    if not label or label == "MainProcess":
+        label = os.path.basename(sys.argv[0] if sys.argv else "") or "python"
+    sock.sendall(
+        ("pdbp session %d %s\n" % (os.getpid(), label.replace("\n", " ")))
+        .encode("utf-8")
+    )
+    remote = RemoteFile(sock)
+    remote.framed = True
+    remote.handshake(2.0)
+    return remote
+
+
+class BrokerSession(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.number = None  # Set by the hello line
+        self.label = None
+        self.hello = b""
+        self.received = b""  # The start of a frame
+        self.backlog = deque()  # Output, while another session is shown
+        self.backlog_size = 0
+        self.waiting = False  # For a command, at the prompt
+        self.pending = deque()  # Typed ahead, for the next prompts
+        self.running_since = None
+
+
+class Broker(object):
+    """Shares one terminal between the debugger sessions of many processes
+    (Eg: pytest-xdist workers). Their set_trace() connects to the socket of
+    the broker ($PDBP_BROKER). A waiting process only blocks itself. One
+    session at a time gets the terminal: when it runs for switch_delay
+    seconds (or ends), the next waiting session takes over, in order of
+    arrival. "sessions" lists them, and "attach N" switches.
+    After the hello line, a session sends frames: a kind byte, the size of
+    the data (4 bytes, big endian), then the data."""
+    output_frame = b"o"
+    prompt_frame = b"p"  # Waiting for a command (No data)
+    max_hello_size = 4096
+    switch_delay = 0.5  # Seconds (So "next" doesn't switch sessions)
+    max_backlog = 65536  # Bytes of output kept for a hidden session
+
+    def __init__(self, path, stdin=None, stdout=None):
+        import selectors
+        self.path = path
+        self.stdin = stdin or sys.stdin
+        self.stdout = stdout or sys.stdout
+        self.selector = selectors.DefaultSelector()
+        self.server = None
+        self.sessions = OrderedDict()  # number --> BrokerSession
+        self.next_number = 1
+        self.current = None
+        self.line = b""  # Typed, not sent yet
+
+    def listen(self):
+        import selectors
+        import socket
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        bind_private(self.server, self.path)
+        self.server.listen(64)
+        self.selector.register(self.server, selectors.EVENT_READ)
+        self.selector.register(self.stdin.fileno(), selectors.EVENT_READ)
+
+    def close(self):
+        for session in list(self.sessions.values()):
+            session.sock.close()
+        self.sessions.clear()
+        self._close_server()
+
+    def _close_server(self):
+        if self.server is not None:
+            self.selector.unregister(self.server)
+            self.server.close()
+            self.server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
 
+    def run(self, process=None):
+        """Serve the sessions until process (a Popen) is done, or forever."""
+        stdin_fd = self.stdin.fileno()
+        while process is None or process.poll() is None or self.sessions:
+            for key, _ in self.selector.select(timeout=0.1):
+                if key.fileobj is self.server:
+                    self._accept()
+                elif key.fileobj == stdin_fd:
+                    self._read_terminal(stdin_fd)
+                elif key.data is not None and key.data.sock.fileno() >= 0:
+                    self._read_session(key.data)  # (Unless closed by now)
+            self._switch_maybe()
 
-CLEARSCREEN = "\033[2J\033[1;1H"
+    @staticmethod
+    def frame(kind, data=b""):
+        import struct
+        return kind + struct.pack(">I", len(data)) + data
+
+    def message(self, msg):
+        self._write(("\n[pdbp] %s\n" % msg).encode("utf-8"))
+
+    def _write(self, data):
+        out = getattr(self.stdout, "buffer", self.stdout)
+        out.write(data)
+        out.flush()
+
+    def _accept(self):
+        import selectors
+        sock, _ = self.server.accept()
+        session = BrokerSession(sock)
+        size = b"- -"  # No terminal: the sessions don't use colors
+        if self.stdout.isatty():
+            size = b"%d %d" % tuple(shutil.get_terminal_size())
+        try:
+            sock.sendall(b"pdbp attach %s\n" % size)
+        except OSError:
+            sock.close()
+            return
+        self.selector.register(sock, selectors.EVENT_READ, session)
 
+    def _read_session(self, session):
+        try:
+            data = session.sock.recv(65536)
+        except OSError:
+            data = b""
+        if not data:
+            self._end(session)
+            return
+        if session.number is None:
+            session.hello += data
+            if b"\n" not in session.hello:
+                if len(session.hello) > self.max_hello_size:
+                    self._end(session)
+                return
+            hello, _, data = session.hello.partition(b"\n")
+            parts = hello.decode("utf-8", "replace").split(" ", 3)
+            if len(parts) < 4 or parts[:2] != ["pdbp", "session"] or not (
+                parts[2].isdigit()
+            ):
+                self._end(session)  # Not a debugger (Eg: a port scan)
+                return
+            session.number = self.next_number
+            self.next_number += 1
+            session.label = "pid %s (%s)" % tuple(parts[2:4])
+            self.sessions[session.number] = session
+        data, waiting = self._read_frames(session, data)
+        if waiting:
+            session.waiting = True
+        elif not data:
+            return  # Only part of a frame
+        if session is self.current:
+            self._write(data)
+            self._send_pending(session)
+            return
+        session.backlog.append(data)
+        session.backlog_size += len(data)
+        while session.backlog_size > self.max_backlog:
+            session.backlog_size -= len(session.backlog.popleft())
+        if session.waiting and self.current is not None and (
+            self.current.waiting
+        ):
+            self.message(
+                'Session %d, %s is waiting. (Use "attach %d")'
+                % (session.number, session.label, session.number)
+            )
+            self._write_prompt()
+
+    def _read_frames(self, session, data):
+        """Return the output of the whole frames received from session,
+        and whether one was a prompt. (The rest waits for the next data)
+        """
+        import struct
+        data = session.received + data
+        output = []
+        waiting = False
+        start = 0
+        while len(data) - start >= 5:
+            kind = data[start:start + 1]
+            size, = struct.unpack(">I", data[start + 1:start + 5])
+            end = start + 5 + size
+            if len(data) < end:
+                break
+            if kind == self.output_frame:
+                output.append(data[start + 5:end])
+            elif kind == self.prompt_frame:
+                waiting = True
+            start = end
+        session.received = data[start:]
+        return b"".join(output), waiting
+
+    def _end(self, session):
+        self.selector.unregister(session.sock)
+        session.sock.close()
+        if session.number is None:
+            return
+        del self.sessions[session.number]
+        if session is self.current:
+            self.current = None
+            self.message("Session %d ended." % session.number)
+
+    def _switch_maybe(self):
+        current = self.current
+        if current is not None and (
+            current.waiting or current.running_since is None
+            or time.monotonic() - current.running_since < self.switch_delay
+        ):
+            return
+        for session in self.sessions.values():
+            if session.waiting and session is not current:
+                self.attach(session)
+                return
 
-def lasti2lineno(code, lasti):
-    import dis
-    linestarts = list(dis.findlinestarts(code))
-    linestarts.reverse()
-    for i, lineno in linestarts:
-        if lasti >= i:
-            return lineno
-    return 0
+    def attach(self, session):
+        self.current = session
+        session.running_since = None
+        self.message("Session %d, %s" % (session.number, session.label))
+        data = b"".join(session.backlog)
+        session.backlog.clear()
+        session.backlog_size = 0
+        self._write(data)
+
+    def _write_prompt(self):
+        """Show the prompt of the current session again (after a message).
+        """
+        if self.current is not None and self.current.waiting:
+            self._write(b"(Pdb+) ")
+
+    def _read_terminal(self, fd):
+        data = os.read(fd, 4096)
+        if not data:
+            # The terminal is gone: detach all sessions, and take no more.
+            self.selector.unregister(fd)
+            self._close_server()
+            for session in list(self.sessions.values()):
+                session.sock.close()
+                self._end(session)
+            return
+        self.line += data
+        while b"\n" in self.line:
+            line, _, self.line = self.line.partition(b"\n")
+            self._handle_line(line + b"\n")
+
+    def _handle_line(self, line):
+        words = line.decode("utf-8", "replace").split()
+        if words[:1] == ["sessions"] and len(words) == 1:
+            self._print_sessions()
+            self._write_prompt()
+            return
+        if words[:1] == ["attach"] and len(words) == 2:
+            session = self.sessions.get(int(words[1])) if (
+                words[1].isdigit()
+            ) else None
+            if session is None:
+                self._write(b"*** No session %s\n" % words[1].encode())
+                self._write_prompt()
+            else:
+                self.attach(session)
+            return
+        if self.current is None:
+            self._write(b'*** No session is attached. (Use "sessions")\n')
+            return
+        self.current.pending.append(line)
+        self._send_pending(self.current)
 
+    def _send_pending(self, session):
+        if not session.waiting or not session.pending:
+            return
+        session.waiting = False
+        session.running_since = time.monotonic()
+        try:
+            session.sock.sendall(session.pending.popleft())
+        except OSError:
+            pass
 
-class Restart(Exception):
-    pass
+    def _print_sessions(self):
+        if not self.sessions:
+            self._write(b"No sessions.\n")
+            return
+        lines = ["     #  State    Process"]
+        for number, session in self.sessions.items():
+            if session is self.current and session.waiting:
+                state = "prompt"
+            elif session.waiting:
+                state = "stopped"
+            else:
+                state = "running"
+            lines.append("%s %4d  %s  %s" % (
+                "*" if session is self.current else " ",
+                number, state.ljust(7), session.label,
+            ))
+        self._write(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+class BoundedRepr(object):
+    """A repr() with limits, modeled on reprlib.Repr: Containers show their
+    first maxitems items, strings their first maxstring characters, and
+    nesting stops at maxlevel, with "… (k more)" markers in their place.
+    numpy arrays and pandas objects are summarized. The output is made in
+    chunks, and it stops after maxchars characters."""
+    containers = {
+        list: ("[", "]"),
+        tuple: ("(", ")"),
+        dict: ("{", "}"),
+        set: ("{", "}"),
+        frozenset: ("frozenset({", "})"),
+        deque: ("deque([", "])"),
+    }
 
+    def __init__(self, maxlevel=6, maxitems=100, maxstring=1000,
+                 maxchars=20000):
+        self.maxlevel = maxlevel
+        self.maxitems = maxitems
+        self.maxstring = maxstring
+        self.maxchars = maxchars
+
+    def is_small(self, obj):
+        """Return True if repr(obj) can be used as-is. (Bounded search)"""
+        budget = self.maxitems * 10
+        stack = [(obj, 0)]
+        seen = set()
+        while stack:
+            obj, level = stack.pop()
+            if isinstance(obj, (str, bytes, bytearray)):
+                if len(obj) > self.maxstring:
+                    return False
+                continue
+            if self.get_summary(obj) is not None:
+                return False
+            if self.get_container(obj) is None or id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            budget -= len(obj)
+            if (
+                len(obj) > self.maxitems
+                or level >= self.maxlevel
+                or budget < 0
+            ):
+                return False
+            if isinstance(obj, dict):
+                for item in obj.items():
+                    stack.append((item[0], level + 1))
+                    stack.append((item[1], level + 1))
+            else:
+                stack.extend((item, level + 1) for item in obj)
+        return True
 
-class Undefined:
-    def __repr__(self):
-        return "<undefined>"
+    def get_container(self, obj):
+        """Return (base, opener, closer) if obj is one of the containers,
+        or a subclass of one (Eg: defaultdict, OrderedDict, Counter). Else
+        None. Subclasses get their type name around the brackets."""
+        kind = type(obj)
+        brackets = self.containers.get(kind)
+        if brackets is not None:
+            return kind, brackets[0], brackets[1]
+        for base, (opener, closer) in self.containers.items():
+            if isinstance(obj, base):
+                return base, "%s(%s" % (kind.__name__, opener), closer + ")"
+        return None
+
+    def get_summary(self, obj):
+        """A short repr for large numpy arrays and pandas objects."""
+        np = sys.modules.get("numpy")
+        if np is not None and isinstance(obj, np.ndarray):
+            if obj.size <= self.maxitems:
+                return None
+            with np.printoptions(threshold=self.maxitems, edgeitems=3):
+                text = repr(obj)
+            return "%s\n<ndarray: shape=%s, dtype=%s, %s>" % (
+                text, obj.shape, obj.dtype, format_size(obj.nbytes)
+            )
+        pd = sys.modules.get("pandas")
+        if pd is not None and isinstance(obj, (pd.DataFrame, pd.Series)):
+            if len(obj) <= self.maxitems:
+                return None
+            try:
+                with pd.option_context(
+                    "display.max_rows", 20, "display.min_rows", 10,
+                    "display.max_columns", 20,
+                ):
+                    text = repr(obj)
+            except Exception:
+                text = repr(obj.head(10))
+            nbytes = obj.memory_usage(deep=False)
+            if hasattr(nbytes, "sum"):
+                nbytes = nbytes.sum()
+            shape = " x ".join(str(n) for n in obj.shape)
+            return "%s\n<%s: shape=%s, %s>" % (
+                text, type(obj).__name__, shape, format_size(int(nbytes))
+            )
+        return None
+
+    def repr_leaf(self, obj, maxlen):
+        if isinstance(obj, (str, bytes, bytearray)) and len(obj) > maxlen:
+            return "%r… (%d more)" % (obj[:maxlen], len(obj) - maxlen)
+        try:
+            s = repr(obj)
+        except Exception:
+            return "<unprintable %s object>" % type(obj).__name__
+        if len(s) > maxlen:
+            s = "%s… (%d more)" % (s[:maxlen], len(s) - maxlen)
+        return s
 
+    def get_items(self, obj, sort=False):
+        items = itertools.islice(
+            obj.items() if isinstance(obj, dict) else obj, self.maxitems
+        )
+        if sort and type(obj) in (dict, set, frozenset) and (
+            len(obj) <= self.maxitems
+        ):
+            # pprint sorts dicts and sets. (Not when they're truncated)
+            items = list(items)
+            try:
+                items.sort()
+            except TypeError:
+                pass
+        return items
 
-undefined = Undefined()
+    def iter_repr(self, obj, level=0, path=(), sort=False):
+        """Yield the bounded repr of obj in chunks."""
+        summary = self.get_summary(obj)
+        if summary is not None:
+            yield summary
+            return
+        container = self.get_container(obj)
+        if container is None or (
+            container[0] is not type(obj) and self.is_small(obj)
+        ):
+            # (Small subclasses keep their own repr. Eg: defaultdict's)
+            yield self.repr_leaf(obj, self.maxstring)
+            return
+        kind, opener, closer = container
+        if not obj and kind in (set, frozenset):
+            yield "%s()" % kind.__name__
+            return
+        if id(obj) in path or (level >= self.maxlevel and obj):
+            more = "..." if id(obj) in path else "… (%d more)" % len(obj)
+            yield "%s%s%s" % (opener, more, closer)
+            return
+        path = path + (id(obj),)
+        yield opener
+        for i, item in enumerate(self.get_items(obj, sort)):
+            if i:
+                yield ", "
+            if kind is dict:
+                yield from self.iter_repr(item[0], level + 1, path, sort)
+                yield ": "
+                item = item[1]
+            yield from self.iter_repr(item, level + 1, path, sort)
+        if len(obj) > self.maxitems:
+            yield ", … (%d more)" % (len(obj) - self.maxitems)
+        elif kind is tuple and len(obj) == 1:
+            yield ","
+        yield closer
+
+    def iter_pformat(self, obj, width, indent=0, level=0, path=()):
+        """Yield the bounded repr of obj in chunks, laid out like pprint."""
+        line = []
+        size = 0
+        for chunk in self.iter_repr(obj, level, path, sort=True):
+            line.append(chunk)
+            size += len(chunk)
+            if indent + size > width:
+                break
+        else:
+            yield "".join(line)
+            return
+        container = self.get_container(obj)
+        if (
+            container is None
+            or level >= self.maxlevel
+            or id(obj) in path
+            or (container[0] is not type(obj) and self.is_small(obj))
+        ):
+            yield from self.iter_repr(obj, level, path, sort=True)
+            return
+        kind, opener, closer = container
+        path = path + (id(obj),)
+        indent += len(opener)
+        separator = ",\n" + " " * indent
+        yield opener
+        for i, item in enumerate(self.get_items(obj, sort=True)):
+            if i:
+                yield separator
+            item_indent = indent
+            if kind is dict:
+                key = "".join(
+                    self.iter_repr(item[0], level + 1, path, sort=True)
+                )
+                yield key + ": "
+                item_indent += len(key) + 2
+                item = item[1]
+            yield from self.iter_pformat(
+                item, width, item_indent, level + 1, path
+            )
+        if len(obj) > self.maxitems:
+            yield "%s… (%d more)" % (separator, len(obj) - self.maxitems)
+        elif kind is tuple and len(obj) == 1:
+            yield ","
+        yield closer
+
+    def write(self, stream, chunks):
+        """Write chunks to stream (in batches), up to maxchars characters."""
+        batch = []
+        size = 0
+        left = self.maxchars
+        for chunk in chunks:
+            if len(chunk) > left:
+                batch.append(chunk[:left])
+                batch.append("… (output truncated)")
+                break
+            batch.append(chunk)
+            left -= len(chunk)
+            size += len(chunk)
+            if size > 8192:
+                stream.write("".join(batch))
+                batch = []
+                size = 0
+        batch.append("\n")
+        stream.write("".join(batch))
+
+    def repr(self, obj):
+        """A bounded repr(obj). (Plain repr(obj) if obj is small)"""
+        if self.is_small(obj):
+            return self.repr_leaf(obj, self.maxchars)
+        stream = StringIO()
+        self.write(stream, self.iter_repr(obj))
+        return stream.getvalue()[:-1]
+
+
+# Dotted names are resolved statically for "safe" attribute completion.
+dotted_name = re.compile(r"^[^\W\d]\w*(\.[^\W\d]\w*)*$")
+safe_attr_types = (
+    types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+    types.ModuleType, type,
+)
+static_dirs = (
+    object.__dict__["__dir__"],
+    type.__dict__["__dir__"],
+    types.ModuleType.__dict__["__dir__"],
+)
+unsafe = object()
+
+
+def call_with_timeout(func, timeout):
+    """Call func in a daemon thread. Return None if it raises, or if it takes
+    longer than timeout seconds. (Then it's left running in the background)"""
+    result = []
+
+    def run():
+        try:
+            result.append(func())
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=run, name="pdbp-timeout", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if result:
+        return result[0]
+    return None
+
+
+class CompletionIndex(object):
+    """The sorted names of a frame's namespaces (locals, globals, builtins),
+    for bisected prefix lookups. Values are looked up through a ChainMap,
+    so nothing gets copied. Names only change while the program runs, or
+    when a statement runs at the prompt: then the Pdb marks the index as
+    stale, and the next Tab press rebuilds it."""
+
+    def __init__(self, frame, f_locals):
+        self.frame = frame
+        self.namespace = ChainMap(f_locals, frame.f_globals, builtins.__dict__)
+        self.names = sorted(self.namespace)
+        self.stale = False
+
+    def is_valid(self, frame):
+        return frame is self.frame and not self.stale
+
+    def matches(self, text):
+        names = self.names
+        i = bisect.bisect_left(names, text)
+        matches = []
+        while i < len(names) and names[i].startswith(text):
+            matches.append(names[i])
+            i += 1
+        return matches
+
+
+class PdbCompleter(Completer):
+    """tabcompleter's Completer, using a CompletionIndex for names.
+    (Created once per Pdb, instead of once per Tab press.)"""
+    keywords = tuple(keyword.kwlist + getattr(keyword, "softkwlist", []))
+
+    def __init__(self, index, safe=True, dir_timeout=None, Config=None):
+        super().__init__(None, Config)
+        self.use_main_ns = 0
+        self.safe = safe
+        self.dir_timeout = dir_timeout
+        self.type_names = LRUCache(256)  # type --> names in its MRO
+        self.set_index(index)
+
+    def set_index(self, index):
+        self.index = index
+        self.namespace = index.namespace
+        self.type_names.clear()  # In case classes were changed
+
+    def global_matches(self, text):
+        n = len(text)
+        seen = {"__builtins__"}
+        names = []
+        for word in self.keywords:
+            if word[:n] == text:
+                seen.add(word)
+                if word in ("finally", "try"):
+                    word = word + ":"
+                elif word not in (
+                    "False", "None", "True", "break", "continue", "pass",
+                    "else", "_",
+                ):
+                    word = word + " "
+                names.append(word)
+        for name in self.index.matches(text):
+            if name not in seen:
+                names.append(name)
+        prefix = tabcompleter.commonprefix(names)
+        if prefix and prefix != text:
+            return [prefix]
+        names.sort()
+        if not (self.config.use_colors and names):
+            return names
+        # Values are only used for colors. (Soft keywords are looked up.)
+        values = []
+        for name in names:
+            clean_name = name.rstrip(": ")
+            if clean_name in keyword.kwlist:
+                values.append(None)
+            else:
+                try:
+                    values.append(self.namespace[clean_name])
+                except Exception as exc:
+                    values.append(exc)
+        return self.color_matches(names, values)
+
+    def attr_matches(self, text):
+        """Same as tabcompleter's attr_matches(), but without copying the
+        namespace. In safe mode, "expr." gets resolved and listed without
+        running properties, __getattr__, or (slow) custom __dir__ methods."""
+        expr, attr = text.rsplit(".", 1)
+        if "(" in expr or ")" in expr:
+            return []
+        if self.safe:
+            thisobject = self._resolve_static(expr)
+            if thisobject is unsafe:
+                return []
+            words = self._get_static_names(thisobject)
+        else:
+            try:
+                thisobject = self._eval(expr)
+            except Exception:
+                return []
+            words = set(dir(thisobject))
+            if hasattr(thisobject, "__class__"):
+                words.add("__class__")
+                words.update(
+                    rlcompleter.get_class_members(thisobject.__class__)
+                )
+        words.discard("__builtins__")
+        names = []
+        n = len(attr)
+        if attr == "":
+            noprefix = "_"
+        elif attr == "_":
+            noprefix = "__"
+        else:
+            noprefix = None
+        words = sorted(words)
+        while True:
+            for word in words:
+                if (
+                    word[:n] == attr
+                    and not (noprefix and word[:n + 1] == noprefix)
+                ):
+                    names.append(word)
+            if names or not noprefix:
+                break
+            if noprefix == "_":
+                noprefix = "__"
+            else:
+                noprefix = None
+        if not names:
+            return []
+        if len(names) == 1:
+            return ["%s.%s" % (expr, names[0])]  # Only option, no coloring.
+        prefix = tabcompleter.commonprefix(names)
+        if prefix and prefix != attr:
+            return ["%s.%s" % (expr, prefix)]  # Autocomplete prefix.
+        if self.config.use_colors:
+            if self.safe:
+                values = [
+                    inspect.getattr_static(thisobject, word, None)
+                    for word in names
+                ]
+            else:
+                values = []
+                for word in names:
+                    try:
+                        values.append(getattr(thisobject, word))
+                    except Exception:
+                        values.append(None)
+            return self.color_matches(names, values)
+        if (
+            not os.getenv("TABCOMPLETER_INCLUDE_PREFIX", "").lower()
+            in ("1", "true", "yes", "on")
+        ):
+            if prefix:
+                names += [" "]
+            return names
+        return ["%s.%s" % (expr, n) for n in names] + ([" "] if prefix else [])
+
+    def _eval(self, expr):
+        return eval(expr, self.index.frame.f_globals, self.namespace)
+
+    def _resolve_static(self, expr):
+        """Return the value of expr, or unsafe if that would run code.
+        Dotted names are looked up with inspect.getattr_static().
+        (Other expressions, Eg: "a[0]", could run any __getitem__.)"""
+        if not dotted_name.match(expr):
+            return unsafe
+        name, *attrs = expr.split(".")
+        try:
+            obj = self.namespace[name]
+        except KeyError:
+            return unsafe
+        for attr in attrs:
+            parent = obj
+            try:
+                obj = inspect.getattr_static(parent, attr)
+            except AttributeError:
+                return unsafe
+            if isinstance(obj, (staticmethod, classmethod)):
+                obj = obj.__func__
+            elif isinstance(
+                obj, (types.MemberDescriptorType, types.GetSetDescriptorType)
+            ):
+                # Slots and C-level attributes are safe to read.
+                if not isinstance(parent, type):
+                    try:
+                        obj = obj.__get__(parent, type(parent))
+                    except Exception:
+                        return unsafe
+            elif not isinstance(obj, safe_attr_types) and hasattr(
+                type(obj), "__get__"
+            ):
+                return unsafe  # A property or custom descriptor
+        return obj
+
+    def _get_type_names(self, cls):
+        """Names defined in the MRO of cls. (Cached per type)"""
+        names = self.type_names.get(cls)
+        if names is None:
+            names = set()
+            try:
+                mro = type.__dict__["__mro__"].__get__(cls)
+            except TypeError:
+                mro = (cls,)
+            for base in mro:
+                try:
+                    names.update(
+                        k for k in type.__dict__["__dict__"].__get__(base)
+                        if isinstance(k, str)
+                    )
+                except TypeError:
+                    pass
+            names = frozenset(names)
+            self.type_names.put(cls, names)
+        return names
+
+    def _get_static_names(self, obj):
+        cls = type(obj)
+        words = set(self._get_type_names(cls))
+        words.add("__class__")
+        if isinstance(obj, type):
+            words.update(self._get_type_names(obj))
+            return words
+        try:
+            instance_dict = object.__getattribute__(obj, "__dict__")
+        except Exception:
+            instance_dict = None
+        if isinstance(instance_dict, dict):
+            words.update(k for k in instance_dict if isinstance(k, str))
+        custom_dir = None
+        for base in cls.__mro__:
+            if "__dir__" in base.__dict__:
+                custom_dir = base.__dict__["__dir__"]
+                break
+        if custom_dir in static_dirs:
+            custom_dir = None
+            if isinstance(instance_dict, dict) and isinstance(
+                obj, types.ModuleType
+            ):
+                custom_dir = instance_dict.get("__dir__")  # PEP 562
+        if custom_dir is not None:
+            names = call_with_timeout(
+                lambda: list(dir(obj)), self.dir_timeout
+            )
+            if names:
+                words.update(k for k in names if isinstance(k, str))
+        return words
 
 
 class Pdb(pdb.Pdb, ConfigurableClass, object):
@@ -205,7 +3062,20 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
             self._disable_pytest_capture_maybe()
         kwargs = self.config.default_pdb_kwargs.copy()
         kwargs.update(**kwds)
+        self._monitoring = None
+        use_monitoring = (
+            self.config.trace_backend == "monitoring"
+            and hasattr(sys, "monitoring")
+        )
+        if use_monitoring and (
+            "backend" in signature(pdb.Pdb.__init__).parameters
+        ):
+            # Python 3.14+ has a sys.monitoring backend of its own.
+            kwargs.setdefault("backend", "monitoring")
+            use_monitoring = False
         super().__init__(*args, **kwargs)
+        if use_monitoring:
+            self._monitoring = MonitoringBackend(self)
         self.prompt = self.config.prompt
         self.display_list = {}  # frame --> (name --> last seen value)
         self.sticky = self.config.sticky_by_default
@@ -220,6 +3090,33 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
         self.stdout = self.ensure_file_can_write_unicode(self.stdout)
         self.saved_curframe = None
         self.last_cmd = None
+        self._highlight_cache = LRUCache(self.config.highlight_cache_size)
+        self._renderer = FrameRenderer(self.config.incremental_render)
+        self._completer = None
+        self._repr = BoundedRepr(
+            maxlevel=self.config.repr_maxlevel,
+            maxitems=self.config.repr_maxitems,
+            maxstring=self.config.repr_maxstring,
+            maxchars=self.config.repr_maxchars,
+        )
+        self._deep_size = DeepSize(
+            self.config.mem_max_objects, self.config.mem_time_limit
+        )
+        self._malloc = MallocTracker()
+        self._profiler = None
+        self._profile_file = None
+        self._profile_monitoring = None
+        self._profile_previous_sigint = None
+        self._line_stats = None
+        self._line_stats_done = False
+        self._switch_to = None
+        self._thread_switched = False
+        self._thread_entries = LRUCache(4096)  # (code, lineno) --> entry
+        self._async_task = None  # The task of "next"/"step" (async_stepping)
+        self._async_loop = None
+        self._task_numbers = weakref.WeakKeyDictionary()
+        self._task_switched = False
+        self._next_task_number = itertools.count(1)
 
     def _runmodule(self, module_name):
         import __main__
@@ -284,6 +3181,26 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
             pass
 
     def interaction(self, frame, traceback):
+        # Threads share the terminal, so stopped threads wait for the prompt.
+        self._thread_switched = thread_registry.acquire()
+        try:
+            return self._interaction(frame, traceback)
+        finally:
+            thread_registry.release()
+
+    def _interaction(self, frame, traceback):
+        task = self._async_task
+        self._task_switched = task is not None and task.done()
+        self._async_task = self._async_loop = None
+        if self._malloc.active:
+            self._malloc.take()
+        if self._profiler is not None:
+            self._profiler.stop()
+        if self._line_stats is not None and self._line_stats.active:
+            self._line_stats.stop()
+            self._line_stats_done = True
+        self._update_trace_hooks()
+        terminal.refresh()
         # Restore the previous signal handler at the Pdb+ prompt.
         if getattr(pdb.Pdb, "_previous_sigint_handler", None):
             try:
@@ -330,11 +3247,35 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
             return super().interaction(frame, traceback)
         self.config.before_interaction_hook(self)
         # Use _cmdloop on Python3, which catches KeyboardInterrupt.
-        if hasattr(self, "_cmdloop"):
-            self._cmdloop()
-        else:
-            self.cmdloop()
+        cmdloop = getattr(self, "_cmdloop", self.cmdloop)
+        cmdloop()
+        while self._switch_to is not None:
+            # "thread N" gave the prompt to another thread. Wait for it back.
+            target, self._switch_to = self._switch_to, None
+            self._thread_switched = thread_registry.handoff(target)
+            terminal.refresh()
+            if not self.sticky:
+                print(file=self.stdout)
+                self.print_stack_entry(self.stack[self.curindex])
+            cmdloop()
         self.forget()
+        if self._monitoring:
+            self._monitoring.resume()
+
+    # Commands whose only output is a new sticky frame, and that run no code
+    # of the program. (Other commands may print below the frame, and the
+    # program may print and scroll the screen, so the next frame gets fully
+    # painted.)
+    redraw_only_commands = (
+        "up", "u", "down", "d", "longlist", "ll", "truncate", "trun",
+    )
+
+    def precmd(self, line):
+        line = super().precmd(line)
+        cmd = line.split()[0] if line.strip() else self.lastcmd
+        if cmd not in self.redraw_only_commands:
+            self._renderer.reset()
+        return line
 
     def print_hidden_frames_count(self):
         n = len(self._hidden_frames)
@@ -346,7 +3287,14 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
                 file=self.stdout,
             )
 
+    def _forget_completions(self):
+        """Names may have changed: rebuild the CompletionIndex on next Tab.
+        """
+        if self._completer is not None:
+            self._completer.index.stale = True
+
     def setup(self, frame, tb):
+        self._forget_completions()
         ret = super().setup(frame, tb)
         if not ret:
             while tb:
@@ -424,24 +3372,43 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
             r.append(comp)
         return r
 
+    def _get_completer(self):
+        frame = self.curframe
+        f_locals = frame.f_locals
+        completer = self._completer
+        if completer and completer.index.is_valid(frame):
+            return completer
+        index = CompletionIndex(frame, f_locals)
+        if completer:
+            completer.set_index(index)
+        else:
+            completer = self._completer = PdbCompleter(
+                index,
+                safe=self.config.safe_attribute_completion,
+                dir_timeout=self.config.completion_dir_timeout,
+            )
+        return completer
+
     def complete(self, text, state):
         """Handle completions from tabcompleter and the original pdb."""
         if state == 0:
-            if GLOBAL_PDB:
-                GLOBAL_PDB._pdbp_completing = True
-            mydict = self.curframe.f_globals.copy()
-            mydict.update(self.curframe.f_locals)
-            completer = Completer(mydict)
+            session = thread_registry.get()
+            if session:
+                session._pdbp_completing = True
+            completer = self._get_completer()
             self._completions = self._get_all_completions(
                 completer.complete, text
             )
-            if not self._completions:
+            if not self._completions and not (
+                # pdb would getattr() its way to the attributes.
+                "." in text and self.config.safe_attribute_completion
+            ):
                 real_pdb = super()
                 for x in self._get_all_completions(real_pdb.complete, text):
                     if x not in self._completions:
                         self._completions.append(x)
-            if GLOBAL_PDB:
-                del GLOBAL_PDB._pdbp_completing
+            if session:
+                del session._pdbp_completing
             # Remove "\t" from tabcompleter if there are pdb completions.
             if len(self._completions) > 1 and self._completions[0] == "\t":
                 self._completions.pop(0)
@@ -473,6 +3440,17 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
             self._fmt = Formatter(bg=self.config.bg,
                                   colorscheme=self.config.colorscheme)
         self._lexer = PythonLexer()
+        self._token_cache = None
+        if self.config.token_cache:
+            self._token_cache = TokenCache(
+                self.config.token_cache_dir,
+                self.config.token_cache_max_size,
+                style="%s %r %r %r" % (
+                    type(self._fmt).__name__,
+                    getattr(self._fmt, "style", None),
+                    self.config.bg, self.config.colorscheme,
+                ),
+            )
         return True
 
     stack_entry_regexp = re.compile(r"(.*?)\(([0-9]+?)\)(.*)", re.DOTALL)
@@ -498,12 +3476,30 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
                 pass
         return s
 
-    def format_source(self, src):
+    def format_source(self, src, width=None):
+        """Highlight src. With width, each line is trimmed and padded to it
+        after lexing, so cached tokens don't depend on the terminal size."""
         if not self._init_pygments():
+            if width is not None:
+                src = "\n".join(
+                    set_line_width(line, width) for line in src.split("\n")
+                )
             return src
-        from pygments import highlight
+        from pygments import format, highlight
         src = self.try_to_decode(src)
-        return highlight(src, self._lexer, self._fmt)
+        tokens = None
+        if (
+            self._token_cache
+            and len(src) >= self.config.token_cache_min_length
+        ):
+            tokens = self._token_cache.get_tokens(src, self._lexer)
+        if width is not None:
+            if tokens is None:
+                tokens = self._lexer.get_tokens(src)
+            tokens = fit_tokens(tokens, width)
+        if tokens is None:
+            return highlight(src, self._lexer, self._fmt)
+        return format(tokens, self._fmt)
 
     def format_line(self, lineno, marker, line):
         lineno = "%4d" % lineno
@@ -560,6 +3556,13 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
         return cmd, arg, newline
 
     def do_inspect(self, arg):
+        try:
+            with self._deadline():
+                self._inspect(arg)
+        except EvaluationTimeout as e:
+            self.error("%s: %s" % (type(e).__name__, e))
+
+    def _inspect(self, arg):
         if not arg:
             print('Inspect Usage: "inspect <VAR>"', file=self.stdout)
             print(
@@ -582,6 +3585,12 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
             data["Length"] = len(obj)
         except TypeError:
             pass
+        try:
+            summary = summarize_data(obj, self.config.inspect_sample_size)
+        except Exception as e:
+            summary = {"Summary": "(failed: %s: %s)" % (type(e).__name__, e)}
+        if summary:
+            data.update(summary)
         try:
             data["File"] = inspect.getabsfile(obj)
         except TypeError:
@@ -610,8 +3619,45 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
 
     def default(self, line):
         self.history.append(line)
+        self._forget_completions()  # (Eg: "x = 1" or "import x")
+        if "await" in line and self._run_await(line):
+            return
         return super().default(line)
 
+    def _run_await(self, line):
+        """Run a statement with a top-level "await". Return False if the
+        line doesn't have one (then pdb runs it)."""
+        import ast
+        if line[:1] == "!":
+            line = line[1:].strip()
+        try:
+            code = compile(
+                line + "\n", "<stdin>", "single",
+                flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT,
+            )
+        except SyntaxError:
+            return False
+        if not code.co_flags & inspect.CO_COROUTINE:
+            return False
+        save_stdout = sys.stdout
+        save_stdin = sys.stdin
+        save_displayhook = sys.displayhook
+        try:
+            sys.stdin = self.stdin
+            sys.stdout = self.stdout
+            sys.displayhook = self.displayhook
+            with self._deadline():
+                run_coroutine(
+                    eval(code, self.curframe.f_globals, self.curframe_locals)
+                )
+        except Exception as e:
+            self.error("%s: %s" % (type(e).__name__, e))
+        finally:
+            sys.stdout = save_stdout
+            sys.stdin = save_stdin
+            sys.displayhook = save_displayhook
+        return True
+
     def do_help(self, arg):
         try:
             return super().do_help(arg)
@@ -678,10 +3724,40 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
             end = min(end, lineno + len(lines))
             lines = lines[start - lineno:end - lineno]
             lineno = start
-        self._print_lines_pdbp(lines, lineno, fnln=fnln, nc_fnln=nc_fnln)
+        self._print_lines_pdbp(
+            lines, lineno, fnln=fnln, nc_fnln=nc_fnln,
+            code=self.curframe.f_code,
+        )
+
+    def _prepare_lines_pdbp(self, lines, width, height):
+        """Return the padded (and highlighted) lines, and the overflow."""
+        lines = [line.replace("\t", "    ")
+                 for line in lines]  # force tabs to 4 spaces
+        lines = [line.rstrip() for line in lines]
+        overflow = 0
+        height_counter = height
+        if not self.config.truncate_long_lines:
+            for line in lines:
+                if len(line) > width - 9:
+                    overflow += 1
+                height_counter -= 1
+                if height_counter <= 0:
+                    break
+        maxlength = None
+        if self.config.truncate_long_lines:
+            maxlength = max(width - 9, 16)
+        if self.config.highlight:
+            # Fill line with spaces. This is important when a bg color is
+            # is used for highlighting the current line (via setbgcolor).
+            src = self.format_source("\n".join(lines), width=maxlength)
+            lines = src.splitlines()
+        elif maxlength:
+            lines = [set_line_width(line, maxlength) for line in lines]
+        return lines, overflow
 
     def _print_lines_pdbp(
-        self, lines, lineno, print_markers=True, fnln=None, nc_fnln=""
+        self, lines, lineno, print_markers=True, fnln=None, nc_fnln="",
+        code=None,
     ):
         dots = "..."
         offset = 0
@@ -710,33 +3786,39 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
         if max_line > 99999:
             offset = 2
         exc_lineno = self.tb_lineno.get(self.curframe, None)
-        lines = [line.replace("\t", "    ")
-                 for line in lines]  # force tabs to 4 spaces
-        lines = [line.rstrip() for line in lines]
         width, height = get_terminal_size()
         width = width - offset
+        line_stats = self._line_stats
+        if code is None or line_stats is None or line_stats.code is not code:
+            line_stats = None
+        else:
+            width -= line_stats.gutter_width
         height = height - 1
-        overflow = 0
-        height_counter = height
-        if not self.config.truncate_long_lines:
-            for line in lines:
-                if len(line) > width - 9:
-                    overflow += 1
-                height_counter -= 1
-                if height_counter <= 0:
-                    break
-        if self.config.truncate_long_lines:
-            maxlength = max(width - 9, 16)
-            lines = [set_line_width(line, maxlength) for line in lines]
+        cache_key = None
+        cached = None
+        if code is not None:
+            cache_key = (
+                code.co_filename,
+                get_mtime(code.co_filename),
+                code,
+                lineno,
+                len(lines),
+                width,
+                height,
+                self.config.truncate_long_lines,
+                self.config.highlight,
+                self.config.use_pygments,
+                self.config.colorscheme,
+                self.config.bg,
+            )
+            cached = self._highlight_cache.get(cache_key)
+        if cached:
+            lines, overflow = cached
+            lines = list(lines)
         else:
-            maxlength = max(map(get_width, lines))
-        if self.config.highlight:
-            # Fill line with spaces. This is important when a bg color is
-            # is used for highlighting the current line (via setbgcolor).
-            tll = self.config.truncate_long_lines
-            lines = [set_line_width(line, maxlength, tll) for line in lines]
-            src = self.format_source("\n".join(lines))
-            lines = src.splitlines()
+            lines, overflow = self._prepare_lines_pdbp(lines, width, height)
+            if cache_key:
+                self._highlight_cache.put(cache_key, (tuple(lines), overflow))
         if height >= 6:
             last_marker_line = max(
                 self.curframe.f_lineno,
@@ -759,6 +3841,10 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
                 marker = ">>"
                 self.config.exception_caught = True
             lines[i] = self.format_line(lineno, marker, line)
+            if line_stats is not None:
+                lines[i] = line_stats.get_gutter(
+                    lineno, self.config.highlight
+                ) + lines[i]
             lineno += 1
         if self.ok_to_clear:
             self.stdout.write(CLEARSCREEN)
@@ -805,6 +3891,34 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
     do_list.__doc__ = pdb.Pdb.do_list.__doc__
     do_l = do_list
 
+    def _compile_conditions(self):
+        for bp in bdb.Breakpoint.bpbynumber:
+            if bp and bp.cond:
+                get_condition_code(bp.cond)
+
+    def do_break(self, arg, temporary=0):
+        if not arg:
+            if self.breaks:
+                print("Num Type         Disp Enb   Where", file=self.stdout)
+                for bp in bdb.Breakpoint.bpbynumber:
+                    if bp:
+                        print(
+                            bp.bpformat() + BreakpointStats.get(bp).format(),
+                            file=self.stdout,
+                        )
+            return
+        ret = super().do_break(arg, temporary)
+        self._compile_conditions()
+        return ret
+    do_break.__doc__ = pdb.Pdb.do_break.__doc__
+    do_b = do_break
+
+    def do_condition(self, arg):
+        ret = super().do_condition(arg)
+        self._compile_conditions()
+        return ret
+    do_condition.__doc__ = pdb.Pdb.do_condition.__doc__
+
     def do_continue(self, arg):
         self.last_cmd = self.lastcmd = "continue"
         if arg != "":
@@ -815,12 +3929,14 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
 
     def do_next(self, arg):
         self.last_cmd = self.lastcmd = "next"
+        self._set_async_task()
         return super().do_next(arg)
     do_next.__doc__ = pdb.Pdb.do_next.__doc__
     do_n = do_next
 
     def do_step(self, arg):
         self.last_cmd = self.lastcmd = "step"
+        self._set_async_task()
         return super().do_step(arg)
     do_step.__doc__ = pdb.Pdb.do_step.__doc__
     do_s = do_step
@@ -831,9 +3947,226 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
     do_until.__doc__ = pdb.Pdb.do_until.__doc__
     do_unt = do_until
 
+    # With async_stepping, "next" and "step" in an asyncio task only stop in
+    # that task, and never in these packages. So "await" is a single step,
+    # which ends when the coroutine resumes.
+    async_internal_packages = frozenset(
+        ["asyncio", "concurrent", "selectors", "uvloop"]
+    )
+    async_code_flags = (
+        inspect.CO_COROUTINE | inspect.CO_ITERABLE_COROUTINE
+        | inspect.CO_ASYNC_GENERATOR
+    )
+
+    def _set_async_task(self):
+        self._async_task = self._async_loop = None
+        if not self.config.async_stepping:
+            return
+        loop = get_running_loop()
+        if loop is None:
+            return
+        self._async_loop = loop
+        self._async_task = sys.modules["asyncio"].current_task(loop)
+        self._update_trace_hooks()
+
+    # The dispatch_*() and stop_here() of linestat, profile and async
+    # stepping run on every trace event. So they're only installed (as
+    # attributes of the instance) while one of them is on, and the events
+    # go to the methods of bdb otherwise.
+    trace_hooks = (
+        "dispatch_call", "dispatch_line", "dispatch_return",
+        "dispatch_exception", "stop_here",
+    )
+
+    def _update_trace_hooks(self):
+        stats = self._line_stats
+        profiler = self._profiler
+        on = (
+            self._async_task is not None
+            or (stats is not None and stats.active and stats.tool_id is None)
+            or (profiler is not None and not profiler.done)
+        )
+        for name in self.trace_hooks:
+            if on:
+                setattr(self, name, getattr(self, "_hooked_" + name))
+            else:
+                self.__dict__.pop(name, None)
+
+    def _get_line_stats(self, frame):
+        """The LineStats that counts the lines of frame here, if any.
+        (Python < 3.12: without sys.monitoring, see LineStats)"""
+        stats = self._line_stats
+        if (
+            stats is not None and stats.active and stats.tool_id is None
+            and frame.f_code is stats.code
+        ):
+            return stats
+        return None
+
+    def _hooked_dispatch_call(self, frame, arg):
+        if (
+            self._async_task is not None
+            and frame.f_code.co_flags & self.async_code_flags
+        ):
+            # A coroutine starts or resumes: no "--Call--" stop.
+            if self.stop_here(frame) or self.break_anywhere(frame):
+                return self.trace_dispatch
+            return None
+        ret = super().dispatch_call(frame, arg)
+        stats = self._get_line_stats(frame)
+        if stats is not None:
+            stats.last.pop(id(frame), None)  # A new frame with the same id
+            return ret or self.trace_dispatch  # Trace its lines too
+        return ret
+
+    def _hooked_dispatch_line(self, frame):
+        stats = self._get_line_stats(frame)
+        if stats is not None:
+            stats.line(id(frame), frame.f_lineno)
+        return super().dispatch_line(frame)
+
+    def _hooked_dispatch_return(self, frame, arg):
+        stats = self._get_line_stats(frame)
+        if stats is not None:
+            stats.leave(id(frame))
+        if (
+            self._async_task is not None
+            and frame.f_code.co_flags & self.async_code_flags
+        ):
+            # A coroutine waits (or is done): no "--Return--" stop.
+            return self.trace_dispatch
+        return super().dispatch_return(frame, arg)
+
+    def _hooked_dispatch_exception(self, frame, arg):
+        if self._async_task is not None and not self.stop_here(frame):
+            # Eg: The StopIteration of a coroutine of asyncio.
+            return self.trace_dispatch
+        return super().dispatch_exception(frame, arg)
+
+    def _hooked_stop_here(self, frame):
+        profiler = self._profiler
+        if profiler is not None and profiler.expired and not profiler.done:
+            return True  # "profile" in a thread other than the main one
+        task = self._async_task
+        if task is None:
+            return super().stop_here(frame)
+        if not task.done():
+            if not super().stop_here(frame) or self._is_async_internal(frame):
+                return False
+            asyncio = sys.modules["asyncio"]
+            return asyncio.current_task(self._async_loop) is task
+        # The task is done. Stop in the next coroutine that runs (Eg: the
+        # task that awaited it), or after the event loop (asyncio.run()).
+        if self._is_async_internal(frame):
+            return False
+        if frame.f_code.co_flags & self.async_code_flags:
+            return True
+        frame = frame.f_back
+        while frame is not None:
+            if self._is_async_internal(frame):
+                return False
+            frame = frame.f_back
+        return True
+
+    def _get_tasks(self):
+        """Return the (number, task) pairs of the pending asyncio tasks of
+        this thread's event loop, or None if no loop is running."""
+        loop = get_running_loop()
+        if loop is None:
+            return None
+        tasks = sorted(
+            sys.modules["asyncio"].all_tasks(loop),
+            key=lambda task: (len(task.get_name()), task.get_name()),
+        )  # Numbers for new tasks go in order of names. (Eg: Task-9, Task-10)
+        rows = [(self._get_task_number(task), task) for task in tasks]
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+    def _get_task_stack(self, task):
+        """Return the frames of the coroutines of task, outermost first."""
+        coro_frame = getattr(task.get_coro(), "cr_frame", None)
+        for i, (frame, _) in enumerate(self.stack):
+            if frame is coro_frame:
+                # The running task (get_stack() would include the loop).
+                return [frame for frame, _ in self.stack[i:]]
+        return task.get_stack()
+
+    def _get_task_number(self, task):
+        number = self._task_numbers.get(task)
+        if number is None:
+            number = self._task_numbers[task] = next(self._next_task_number)
+        return number
+
+    def do_tasks(self, arg):
+        """List the pending asyncio tasks of the event loop of this thread.
+        (Use "task N" to see the coroutine stack of a task.)"""
+        self.last_cmd = self.lastcmd = "tasks"
+        tasks = self._get_tasks()
+        if tasks is None:
+            print("No event loop is running in this thread.", file=self.stdout)
+            return
+        current = sys.modules["asyncio"].current_task(get_running_loop())
+        width = max([len(task.get_name()) for _, task in tasks] + [4])
+        print(
+            "     #  %s  State    Location" % "Task".ljust(width),
+            file=self.stdout,
+        )
+        for number, task in tasks:
+            stack = self._get_task_stack(task)
+            if stack:
+                location = "%s:%d in %s" % (
+                    stack[-1].f_code.co_filename,
+                    stack[-1].f_lineno,
+                    stack[-1].f_code.co_name,
+                )
+            else:
+                location = getattr(task.get_coro(), "__qualname__", "")
+            print(
+                "%s %4d  %s  %s  %s" % (
+                    "*" if task is current else " ",
+                    number, task.get_name().ljust(width),
+                    ("running" if task is current else "pending").ljust(7),
+                    location,
+                ),
+                file=self.stdout,
+            )
+
+    def do_task(self, arg):
+        """Print the coroutine stack of an asyncio task (see "tasks"), and
+        the future that it waits for. Usage: task N"""
+        self.last_cmd = self.lastcmd = "task"
+        try:
+            number = int(arg)
+        except ValueError:
+            print('Task usage: "task N"', file=self.stdout)
+            return
+        tasks = self._get_tasks()
+        if tasks is None:
+            print("No event loop is running in this thread.", file=self.stdout)
+            return
+        for n, task in tasks:
+            if n == number:
+                break
+        else:
+            self.error("No pending task %d" % number)
+            return
+        print("Task %d (%s)" % (number, task.get_name()), file=self.stdout)
+        for frame in self._get_task_stack(task):
+            entry = self.format_stack_entry(
+                (frame, frame.f_lineno), pdb.line_prefix
+            )
+            print("  " + entry.replace("\n", "\n  "), file=self.stdout)
+        waiter = getattr(task, "_fut_waiter", None)
+        if waiter is not None:
+            print("  Waiting for: %s" % refs_repr.repr(waiter),
+                  file=self.stdout)
+
     def do_p(self, arg):
+        full = arg.startswith("!")
+        if full:
+            arg = arg[1:].strip()
         try:
-            self.message(repr(self._getval(arg)))
+            val = self._getval(arg)
         except Exception:
             if not arg:
                 print('Print usage: "p <VAR>"', file=self.stdout)
@@ -848,12 +4181,25 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
                     file=self.stdout,
                 )
                 return
-    do_p.__doc__ = pdb.Pdb.do_p.__doc__
+        try:
+            with self._deadline():
+                if full:
+                    self.message(repr(val))
+                else:
+                    self.message(self._repr.repr(val))
+        except Exception as e:
+            self.error("%s: %s" % (type(e).__name__, e))
+    do_p.__doc__ = (pdb.Pdb.do_p.__doc__ or "") + """
+        Large objects are shortened. (Use "p! expression" to print all)
+        """
 
     def do_pp(self, arg):
         width, _ = get_terminal_size()
+        full = arg.startswith("!")
+        if full:
+            arg = arg[1:].strip()
         try:
-            pprint.pprint(self._getval(arg), self.stdout, width=width)
+            val = self._getval(arg)
         except Exception:
             if not arg:
                 print('PrettyPrint usage: "pp <VAR>"', file=self.stdout)
@@ -868,7 +4214,24 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
                     file=self.stdout,
                 )
                 return
-    do_pp.__doc__ = pdb.Pdb.do_pp.__doc__
+        try:
+            with self._deadline():
+                if full:
+                    pprint.pprint(val, self.stdout, width=width)
+                elif self._repr.is_small(val):
+                    # (The repr of a leaf can still be long)
+                    self._repr.write(
+                        self.stdout, [pprint.pformat(val, width=width)]
+                    )
+                else:
+                    self._repr.write(
+                        self.stdout, self._repr.iter_pformat(val, width)
+                    )
+        except Exception as e:
+            self.error("%s: %s" % (type(e).__name__, e))
+    do_pp.__doc__ = (pdb.Pdb.do_pp.__doc__ or "") + """
+        Large objects are shortened. (Use "pp! expression" to print all)
+        """
 
     def do_debug(self, arg):
         self.last_cmd = self.lastcmd = "debug"
@@ -907,33 +4270,628 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
         ns.update(self.curframe.f_locals)
         code.interact("*interactive*", local=ns)
 
-    def do_track(self, arg):
+    def _get_ref_graph(self, max_depth):
+        frames = [
+            (frame, self.curframe_locals if frame is self.curframe
+             else frame.f_locals)
+            for frame, _ in self.stack
+        ]
+        ignore = [self, self.stack, self.display_list]
+        ignore.extend(self.display_list.values())
         try:
-            from rpython.translator.tool.reftracker import track
-        except ImportError:
+            ignore.append(object.__getattribute__(self, "__dict__"))
+        except AttributeError:
+            pass
+        return RefGraph(
+            max_depth, self.config.refs_max_objects, ignore, frames
+        )
+
+    def _parse_depth(self, arg, default):
+        depth, _, expr = arg.strip().partition(" ")
+        if depth.isdigit() and expr.strip():
+            return int(depth), expr.strip()
+        return default, arg.strip()
+
+    def do_refs(self, arg):
+        """Show what an object refers to, as a tree. Usage: refs [depth] expr
+        (The default depth is 1)"""
+        self.last_cmd = self.lastcmd = "refs"
+        depth, arg = self._parse_depth(arg, 1)
+        if not arg:
+            print('Refs usage: "refs [depth] expr"', file=self.stdout)
+            return
+        try:
+            obj = self._getval(arg)
+        except Exception:
+            return
+        graph = self._get_ref_graph(depth)
+        try:
+            with self._deadline():
+                for level, label, node in graph.iter_referents(
+                    obj, depth, self.config.refs_max_lines
+                ):
+                    print(
+                        "%s%s%s  %s" % (
+                            "    " * level,
+                            label.strip() + "  " if label else "",
+                            type(node).__name__,
+                            refs_repr.repr(node),
+                        ),
+                        file=self.stdout,
+                    )
+        except EvaluationTimeout as e:
+            self.error("%s: %s" % (type(e).__name__, e))
+            return
+        if graph.truncated:
             print(
-                "** cannot import pypy.translator.tool.reftracker **",
+                "(stopped at refs_max_objects/refs_max_lines)",
                 file=self.stdout,
             )
+    do_track = do_refs
+
+    def do_referrers(self, arg):
+        """Show the shortest paths to an object, from module globals and from
+        frames. Usage: referrers [depth] expr
+        (The default depth is refs_max_depth. Each level scans the gc heap.
+        Containers of only atomic values, Eg: {"a": 1}, are not tracked by
+        the gc, so search for such a container instead of its items.)"""
+        self.last_cmd = self.lastcmd = "referrers"
+        depth, arg = self._parse_depth(arg, self.config.refs_max_depth)
+        if not arg:
             print(
-                "This command requires pypy to be in the current PYTHONPATH.",
-                file=self.stdout,
+                'Referrers usage: "referrers [depth] expr"', file=self.stdout
             )
             return
         try:
-            val = self._getval(arg)
+            obj = self._getval(arg)
         except Exception:
-            pass
+            return
+        graph = self._get_ref_graph(depth)
+        try:
+            with self._deadline():
+                paths = graph.find_paths(obj, self.config.refs_max_lines)
+                for path in paths:
+                    print(graph.format_path(path), file=self.stdout)
+        except EvaluationTimeout as e:
+            self.error("%s: %s" % (type(e).__name__, e))
+            return
+        if not paths:
+            print("No path from module globals or frames.", file=self.stdout)
+        if graph.truncated:
+            print(
+                "(stopped at depth %d or at refs_max_objects; there may be"
+                " more paths)" % graph.max_depth,
+                file=self.stdout,
+            )
+
+    def do_mem(self, arg):
+        """Show the deep size of each local variable (biggest first), or of
+        an expression. Usage: mem [expr]
+        (Sizes of tuples of immutable objects are reused. mem! recounts)"""
+        self.last_cmd = self.lastcmd = "mem"
+        recount = arg.startswith("!")
+        if recount:
+            arg = arg[1:].strip()
+        if arg:
+            try:
+                items = [(arg, self._getval(arg))]
+            except Exception:
+                return
+        else:
+            items = list(self.curframe_locals.items())
+        start = time.perf_counter()
+        try:
+            with self._deadline():
+                results = self._deep_size.measure(
+                    [value for _, value in items],
+                    exclude=(self, self.stack),
+                    recount=recount,
+                )
+        except EvaluationTimeout as e:
+            self.error("%s: %s" % (type(e).__name__, e))
+            return
+        rows = [
+            (size, count, complete, name, value)
+            for (size, count, complete, _), (name, value)
+            in zip(results, items)
+        ]
+        n_reused = sum(result[3] for result in results)
+        partial = not all(result[2] for result in results)
+        rows.sort(key=lambda row: row[0], reverse=True)
+        width = min(max([4] + [len(row[3]) for row in rows]), 30)
+        print(
+            "%-*s %12s %10s  %s" % (width, "Name", "Size", "Objects", "Type"),
+            file=self.stdout,
+        )
+        for size, count, complete, name, value in rows:
+            print(
+                "%-*s %12s %10d  %s" % (
+                    width,
+                    name if len(name) <= width else name[:width - 3] + "...",
+                    ("" if complete else ">= ") + format_size(size),
+                    count,
+                    type(value).__name__,
+                ),
+                file=self.stdout,
+            )
+        notes = ["%.3f s" % (time.perf_counter() - start)]
+        if n_reused:
+            notes.append("%d reused" % n_reused)
+        if partial:
+            notes.append(
+                "stopped at mem_max_objects/mem_time_limit, so >= sizes"
+                " are partial"
+            )
+        print("(%s)" % ", ".join(notes), file=self.stdout)
+
+    def do_malloc(self, arg):
+        """Trace memory allocations with tracemalloc. Usage:
+        malloc start [nframes]  Start tracing (and snapshots at each stop)
+        malloc top [count]      Lines with the most memory at this stop
+        malloc diff [count]     Lines that grew the most since the last stop
+        malloc stop             Stop tracing
+        (nframes defaults to 16. Allocations are left out when a frame of
+        the debugger is in their traceback, so fewer frames show more.)"""
+        self.last_cmd = self.lastcmd = "malloc"
+        import tracemalloc
+        command, _, count = arg.strip().partition(" ")
+        try:
+            count = int(count) if count.strip() else None
+        except ValueError:
+            self.error("Bad count: %s" % count)
+            return
+        tracker = self._malloc
+        if command == "start":
+            tracker.start(count)
+            print(
+                "Tracing allocations (%d frame%s)." % (
+                    tracemalloc.get_traceback_limit(),
+                    "s" if tracemalloc.get_traceback_limit() > 1 else "",
+                ),
+                file=self.stdout,
+            )
+            return
+        if command == "stop":
+            tracker.stop()
+            print("Stopped tracing allocations.", file=self.stdout)
+            return
+        if command not in ("top", "diff"):
+            print(
+                'Malloc usage: "malloc start|top|diff|stop [count]"',
+                file=self.stdout,
+            )
+            return
+        if not tracker.active:
+            if not tracemalloc.is_tracing():
+                self.error('Not tracing allocations. (Use "malloc start")')
+                return
+            tracker.start()  # tracemalloc was started by the program
+        count = count or 10
+        if command == "top":
+            stats = tracker.snapshot.statistics("lineno")
+            total = sum(stat.size for stat in stats)
+            print(
+                "Top %d lines of %s allocated (in %d blocks):" % (
+                    min(count, len(stats)), format_size(total),
+                    sum(stat.count for stat in stats),
+                ),
+                file=self.stdout,
+            )
+            for stat in stats[:count]:
+                self._print_malloc_stat(
+                    format_size(stat.size), "%d" % stat.count,
+                    stat.traceback[0],
+                )
+            return
+        if tracker.previous is None:
+            print(
+                "No snapshot of a previous stop yet. (Step, and try again)",
+                file=self.stdout,
+            )
+            return
+        stats = tracker.snapshot.compare_to(tracker.previous, "lineno")
+        size_diff = sum(stat.size_diff for stat in stats)
+        print(
+            "Top %d changes since the previous stop (%s%s in %+d blocks):" % (
+                min(count, len(stats)), "-" if size_diff < 0 else "+",
+                format_size(abs(size_diff)),
+                sum(stat.count_diff for stat in stats),
+            ),
+            file=self.stdout,
+        )
+        for stat in stats[:count]:
+            if not stat.size_diff and not stat.count_diff:
+                break
+            self._print_malloc_stat(
+                ("-" if stat.size_diff < 0 else "+")
+                + format_size(abs(stat.size_diff)),
+                "%+d" % stat.count_diff,
+                stat.traceback[0],
+            )
+
+    def _print_malloc_stat(self, size, count, frame):
+        import linecache
+        line = linecache.getline(frame.filename, frame.lineno).strip()
+        print(
+            "%12s %9s  %s:%d  %s" % (
+                size, count, frame.filename, frame.lineno, line[:60]
+            ),
+            file=self.stdout,
+        )
+
+    def do_profile(self, arg):
+        """Continue for some seconds while sampling the stack, then stop and
+        show the hottest functions and lines.
+        Usage: profile seconds [interval] [collapsed_stacks_file]
+        (A breakpoint stops it earlier. The file gets the stacks in the
+        "collapsed" format of flamegraph.pl, which speedscope reads too.
+        If the program is in a blocking call (Eg: a sleep or a socket read)
+        when the time is up, it stops once that call returns)"""
+        self.last_cmd = self.lastcmd = "profile"
+        args = arg.split()
+        try:
+            seconds = float(args.pop(0))
+            interval = self.config.profile_interval
+            if args:
+                try:
+                    interval = float(args[0])
+                    args.pop(0)
+                except ValueError:
+                    pass
+        except (IndexError, ValueError):
+            print(
+                'Profile usage: "profile seconds [interval] [file]"',
+                file=self.stdout,
+            )
+            return
+        if seconds <= 0 or interval <= 0:
+            self.error("The seconds and the interval must be positive.")
+            return
+        self._profile_file = " ".join(args) or None
+        self._profiler = SamplingProfiler(
+            threading.get_ident(), seconds, interval, self._profile_timeout
+        )
+        self._update_trace_hooks()
+        if threading.current_thread() is threading.main_thread():
+            # When time is up, the helper thread interrupts the main thread,
+            # so the program runs without a trace function until then.
+            ret = self.do_continue("")
+            self._profile_previous_sigint = signal.getsignal(signal.SIGINT)
+            signal.signal(signal.SIGINT, self._profile_sigint_handler)
+        else:
+            # Only the main thread can be interrupted, so other threads keep
+            # the trace function, and stop_here() checks for the timeout.
+            if self._monitoring:
+                self._monitoring.stop()
+                self._profile_monitoring = self._monitoring
+                self._monitoring = None
+            self._set_stopinfo(self.botframe, None, -1)
+            sys.settrace(self.trace_dispatch)
+            ret = 1
+        self._profiler.start()
+        return ret
+
+    def _profile_timeout(self):
+        profiler = self._profiler
+        if profiler and profiler.thread_id == threading.main_thread().ident:
+            # A real signal also interrupts a blocking call (Eg: a sleep).
+            # (interrupt_main() only runs the handler once the call returns)
+            if hasattr(signal, "pthread_kill"):
+                signal.pthread_kill(profiler.thread_id, signal.SIGINT)
+            else:
+                import _thread
+                _thread.interrupt_main()
+
+    def _profile_sigint_handler(self, signum, frame):
+        previous = self._profile_previous_sigint
+        if signal.getsignal(signal.SIGINT) == self._profile_sigint_handler:
+            signal.signal(signal.SIGINT, previous)
+        profiler = self._profiler
+        if profiler is None or profiler.done or (
+            frame.f_code.co_filename in MonitoringBackend.internal_files
+        ):
+            return  # Stopped already (Eg: at a breakpoint)
+        if not profiler.expired and callable(previous):
+            return previous(signum, frame)  # A Ctrl-C from the user
+        self.set_trace(frame)
+
+    def _is_async_internal(self, frame):
+        name = frame.f_globals.get("__name__") or ""
+        if name.partition(".")[0] in self.async_internal_packages:
+            return True
+        return bool(self.skip) and self.is_skipped_module(name)
+
+    def _print_profile(self):
+        profiler = self._profiler
+        self._profiler = None
+        if self._profile_monitoring is not None:
+            self._monitoring = self._profile_monitoring
+            self._profile_monitoring = None
+        if profiler.expired:
+            print("Profile finished.", file=self.stdout)
+        else:
+            print("Profile stopped early.", file=self.stdout)
+        for line in profiler.iter_report(self.config.profile_top_count):
+            print(line, file=self.stdout)
+        if self._profile_file:
+            try:
+                profiler.write_collapsed(self._profile_file)
+            except OSError as e:
+                self.error("%s: %s" % (type(e).__name__, e))
+            else:
+                print(
+                    "Collapsed stacks written to %s" % self._profile_file,
+                    file=self.stdout,
+                )
+
+    def do_linestat(self, arg):
+        """Count hits and time per line of the current function, until it
+        returns (or a breakpoint is hit). The sticky view then shows them
+        in a gutter. Usage: linestat [show|clear]"""
+        self.last_cmd = self.lastcmd = "linestat"
+        arg = arg.strip()
+        if arg == "show":
+            if self._line_stats is None or not self._line_stats.hits:
+                print("No line stats.", file=self.stdout)
+                return
+            for line in self._line_stats.iter_report():
+                print(line, file=self.stdout)
+            return
+        if arg == "clear":
+            self._line_stats = None
+            return
+        if arg:
+            print('Linestat usage: "linestat [show|clear]"', file=self.stdout)
+            return
+        code = self.curframe.f_code
+        self._line_stats = LineStats(code)
+        if not hasattr(sys, "monitoring"):
+            for frame, _ in self.stack:
+                if frame.f_code is code and frame.f_trace is None:
+                    frame.f_trace = self.trace_dispatch
+        try:
+            self._line_stats.start()
+        except (RuntimeError, ValueError) as e:
+            self._line_stats = None
+            self.error("%s: %s" % (type(e).__name__, e))
+            return
+        self._update_trace_hooks()
+        return self.do_return("")
+
+    def _get_thread_location(self, frame):
+        """Return "file:line in func" of the innermost non-debugger frame."""
+        internal_files = RefGraph.internal_files | {threading.__file__}
+        while frame is not None and (
+            frame.f_code.co_filename in internal_files
+        ):
+            frame = frame.f_back
+        if frame is None:
+            return ""
+        return "%s:%d in %s" % (
+            frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name
+        )
+
+    def do_threads(self, arg):
+        """List the threads. (Stopped threads wait for the prompt, and
+        "thread N" switches to one of them.) "threads bt" prints the
+        stacks of all threads, with identical stacks grouped together.
+        Usage: threads [bt]"""
+        self.last_cmd = self.lastcmd = "threads"
+        arg = arg.strip()
+        if arg == "bt":
+            self._print_thread_stacks()
+            return
+        if arg:
+            print('Threads usage: "threads [bt]"', file=self.stdout)
+            return
+        frames = sys._current_frames()
+        rows = []
+        with thread_registry.cond:
+            for thread in threading.enumerate():
+                if thread.name.startswith("pdbp-"):
+                    continue  # The helper threads of the debugger
+                ident = thread.ident
+                rows.append((
+                    thread_registry.get_number(ident),
+                    "%s (%d)" % (thread.name, ident),
+                    thread_registry.get_state(ident),
+                    self._get_thread_location(frames.get(ident)),
+                    ident == threading.get_ident(),
+                ))
+        rows.sort()
+        width = max(len(row[1]) for row in rows)
+        print(
+            "     #  %s  State    Location" % "Thread".ljust(width),
+            file=self.stdout,
+        )
+        for number, name, state, location, current in rows:
+            print(
+                "%s %4d  %s  %s  %s" % (
+                    "*" if current else " ",
+                    number, name.ljust(width), state.ljust(7), location,
+                ),
+                file=self.stdout,
+            )
+
+    def _print_thread_stacks(self):
+        frames = sys._current_frames()  # All threads, at the same moment
+        threads = dict((t.ident, t) for t in threading.enumerate())
+        for ident in list(frames):
+            thread = threads.get(ident)
+            if thread is not None and thread.name.startswith("pdbp-"):
+                del frames[ident]
+        groups = group_thread_stacks(frames, RefGraph.internal_files)
+        del frames
+        current = threading.get_ident()
+        with thread_registry.cond:
+            numbers = dict(
+                (ident, thread_registry.get_number(ident)) for ident in threads
+            )
+        for idents, stack in groups:
+            idents.sort(key=lambda ident: numbers.get(ident, 0))
+            names = [
+                "%d (%s)" % (numbers[ident], threads[ident].name)
+                if ident in threads else str(ident)
+                for ident in idents[:8]
+            ]
+            if len(idents) > 8:
+                names.append("+%d more" % (len(idents) - 8))
+            # Threads that wait on a lock are "blocked in" the caller of
+            # threading. (Eg: queue.get)
+            for frame, _ in stack:
+                if frame.f_code.co_filename != threading.__file__:
+                    break
+            else:
+                frame = stack[0][0]  # Eg: threading.Event.wait
+            where = "%s %s.%s" % (
+                "blocked in" if (
+                    stack[0][0].f_code.co_filename == threading.__file__
+                ) else "in",
+                frame.f_globals.get("__name__", "?"),
+                frame.f_code.co_name,
+            )
+            if len(idents) == 1:
+                title = "Thread %s %s" % (names[0], where)
+            else:
+                title = "%d threads %s: %s" % (
+                    len(idents), where, ", ".join(names)
+                )
+            print(file=self.stdout)
+            print(
+                "%s %s" % ("*" if current in idents else " ", title),
+                file=self.stdout,
+            )
+            for frame, lineno in reversed(stack):
+                entry = self._format_thread_entry(frame, lineno)
+                print("  " + entry.replace("\n", "\n  "), file=self.stdout)
+
+    def _format_thread_entry(self, frame, lineno):
+        """format_stack_entry(), cached by code object and line number."""
+        key = (frame.f_code, lineno)
+        entry = self._thread_entries.get(key)
+        if entry is None:
+            # The other threads keep running, so leave their locals alone.
+            frame = types.SimpleNamespace(
+                f_code=frame.f_code, f_locals={}, f_globals=frame.f_globals
+            )
+            entry = self.format_stack_entry((frame, lineno), pdb.line_prefix)
+            self._thread_entries.put(key, entry)
+        return entry
+
+    def do_thread(self, arg):
+        """Give the prompt to a stopped thread (see "threads"). This
+        thread stays stopped, and gets the prompt back when that thread
+        continues. Usage: thread N"""
+        self.last_cmd = self.lastcmd = "thread"
+        try:
+            number = int(arg)
+        except ValueError:
+            print('Thread usage: "thread N"', file=self.stdout)
+            return
+        with thread_registry.cond:
+            for ident, n in thread_registry.numbers.items():
+                if n == number:
+                    break
+            else:
+                self.error("No thread %d" % number)
+                return
+            state = thread_registry.get_state(ident)
+        if ident not in sys._current_frames():
+            state = "finished"
+        if ident == threading.get_ident():
+            print("Already in thread %d." % number, file=self.stdout)
+            return
+        if state != "stopped":
+            self.error("Thread %d is %s, not stopped" % (number, state))
+            return
+        self._switch_to = ident
+        return 1
+
+    def do_logpoint(self, arg):
+        """Log values without stopping.
+        Usage: logpoint [filename:]lineno expr [, expr...]
+        (Use "logs" to view them, and "clear" to remove the logpoint.)"""
+        self.last_cmd = self.lastcmd = "logpoint"
+        location, _, exprs = arg.strip().partition(" ")
+        if not exprs.strip():
+            print(
+                'Logpoint usage: "logpoint [filename:]lineno expr [, expr]"',
+                file=self.stdout,
+            )
+            return
+        filename, _, lineno = location.rpartition(":")
+        if filename:
+            f = self.lookupmodule(filename)
+            if not f:
+                self.error("%r not found from sys.path" % filename)
+                return
+            filename = f
         else:
-            track(val)
+            filename = self.defaultFile()
+        try:
+            lineno = int(lineno)
+        except ValueError:
+            self.error("Bad lineno: %s" % lineno)
+            return
+        import ast
+        source = "(%s\n,)" % exprs.strip()
+        try:
+            exprs = [
+                ast.get_source_segment(source, node)
+                for node in ast.parse(source, mode="eval").body.elts
+            ]
+        except SyntaxError:
+            self.error("Bad expression: %s" % exprs.strip())
+            return
+        if not self.checkline(filename, lineno):
+            return
+        filename = self.canonic(filename)
+        global log_sink
+        if log_sink is None:
+            log_sink = LogSink(
+                self.config.logpoint_buffer_size,
+                self.config.logpoint_flush_interval,
+                self.config.logpoint_file,
+            )
+        lines = self.breaks.setdefault(filename, [])
+        if lineno not in lines:
+            lines.append(lineno)
+        bp = LogPoint(filename, lineno, exprs, log_sink)
+        print(
+            "Logpoint %d at %s:%d" % (bp.number, bp.file, bp.line),
+            file=self.stdout,
+        )
+
+    def do_logs(self, arg):
+        """Show recent logpoint records. Usage: logs [count]"""
+        self.last_cmd = self.lastcmd = "logs"
+        try:
+            count = int(arg) if arg else 20
+        except ValueError:
+            self.error("Bad count: %s" % arg)
+            return
+        if log_sink is None or not log_sink.records:
+            print("No logpoint records.", file=self.stdout)
+            return
+        records = list(log_sink.records)
+        for record in records[-count:]:
+            print(LogSink.format(record), file=self.stdout)
 
     def _get_display_list(self):
         return self.display_list.setdefault(self.curframe, {})
 
+    def _deadline(self):
+        return Deadline(self.config.eval_timeout)
+
+    def _getval(self, arg):
+        with self._deadline():
+            return super()._getval(arg)
+
     def _getval_or_undefined(self, arg):
         try:
-            return eval(arg, self.curframe.f_globals,
-                        self.curframe.f_locals)
+            with self._deadline():
+                return eval(arg, self.curframe.f_globals,
+                            self.curframe.f_locals)
         except NameError:
             return undefined
 
@@ -972,135 +4930,147 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
 
     def _print_if_sticky(self):
         if self.sticky:
-            if self.first_time_sticky:
-                self.first_time_sticky = False
-            self.ok_to_clear = True
-            frame, lineno = self.stack[self.curindex]
-            filename = self.canonic(frame.f_code.co_filename)
-            lno = Color.set(self.config.line_number_color, "%r" % lineno)
-            short_filename = filename
-            if self.config.shorten_path:
+            # Collect the whole frame, and then write it all at once.
+            oldstdout = self.stdout
+            self.stdout = StringIO()
+            try:
+                self._print_sticky_frame()
+            finally:
+                text = self.stdout.getvalue()
+                self.stdout = oldstdout
+            self._renderer.render(self.stdout, text)
+
+    def _print_sticky_frame(self):
+        if self.first_time_sticky:
+            self.first_time_sticky = False
+        self.ok_to_clear = True
+        frame, lineno = self.stack[self.curindex]
+        filename = self.canonic(frame.f_code.co_filename)
+        lno = Color.set(self.config.line_number_color, "%r" % lineno)
+        short_filename = filename
+        if self.config.shorten_path:
+            try:
+                home_dir = os.path.expanduser("~")
+                if (
+                    len(home_dir) > 4
+                    and filename.startswith(home_dir)
+                    and filename.count(home_dir) == 1
+                ):
+                    short_filename = filename.replace(home_dir, "~")
+            except Exception:
+                pass
+        fname = Color.set(self.config.filename_color, short_filename)
+        fnln = None
+        if not self.curindex:
+            self.curindex = 0
+        colored_index = Color.set(self.config.stack_color, self.curindex)
+        fnln = "[%s] > %s(%s)" % (colored_index, fname, lno)
+        nc_fnln = "[%s] > %s(%s)" % (self.curindex, filename, lineno)
+        sticky_range = self.sticky_ranges.get(self.curframe, None)
+        self._printlonglist(sticky_range, fnln=fnln, nc_fnln=nc_fnln)
+        needs_extra_line = False
+        if "__exception__" in frame.f_locals:
+            s = self._format_exc_for_sticky(
+                frame.f_locals["__exception__"]
+            )
+            if s:
+                last_return_color = self.config.last_return_color
+                if (
+                    last_return_color == self.config.pm_return_value_color
+                    and not self.config.exception_caught
+                ):
+                    print(s, file=self.stdout)
+                    needs_extra_line = True
+        elif "exc" in frame.f_locals and "msg" in frame.f_locals:
+            s = str(frame.f_locals["msg"]).strip()
+            e = str(frame.f_locals["exc"]).strip()
+            e = e.split("<class '")[-1].split("'>")[0] + ":"
+            if s and self.has_traceback:
+                if self.config.highlight:
+                    the_return_color = self.__get_return_color(s)
+                    s = Color.set(the_return_color, s)
+                    e = Color.set(the_return_color, e)
+                last_return_color = self.config.last_return_color
+                lastline = None
                 try:
-                    home_dir = os.path.expanduser("~")
-                    if (
-                        len(home_dir) > 4
-                        and filename.startswith(home_dir)
-                        and filename.count(home_dir) == 1
-                    ):
-                        short_filename = filename.replace(home_dir, "~")
+                    lastline = inspect.getsourcelines(self.curframe)[0][-1]
+                    lastline = str(lastline)
                 except Exception:
-                    pass
-            fname = Color.set(self.config.filename_color, short_filename)
-            fnln = None
-            if not self.curindex:
-                self.curindex = 0
-            colored_index = Color.set(self.config.stack_color, self.curindex)
-            fnln = "[%s] > %s(%s)" % (colored_index, fname, lno)
-            nc_fnln = "[%s] > %s(%s)" % (self.curindex, filename, lineno)
-            sticky_range = self.sticky_ranges.get(self.curframe, None)
-            self._printlonglist(sticky_range, fnln=fnln, nc_fnln=nc_fnln)
-            needs_extra_line = False
-            if "__exception__" in frame.f_locals:
-                s = self._format_exc_for_sticky(
-                    frame.f_locals["__exception__"]
-                )
-                if s:
-                    last_return_color = self.config.last_return_color
-                    if (
-                        last_return_color == self.config.pm_return_value_color
-                        and not self.config.exception_caught
-                    ):
-                        print(s, file=self.stdout)
-                        needs_extra_line = True
-            elif "exc" in frame.f_locals and "msg" in frame.f_locals:
+                    lastline = ""
+                if (
+                    last_return_color == self.config.pm_return_value_color
+                    and not self.config.exception_caught
+                    and "raise " in lastline
+                    and "(msg" in lastline.replace(" ", "")
+                ):
+                    print(e, file=self.stdout)
+                    print(" " + s, file=self.stdout)
+                    needs_extra_line = True
+        elif "msg" in frame.f_locals or "message" in frame.f_locals:
+            s = None
+            s2 = None
+            if "msg" in frame.f_locals:
                 s = str(frame.f_locals["msg"]).strip()
-                e = str(frame.f_locals["exc"]).strip()
-                e = e.split("<class '")[-1].split("'>")[0] + ":"
-                if s and self.has_traceback:
-                    if self.config.highlight:
+            if "message" in frame.f_locals:
+                s2 = str(frame.f_locals["message"]).strip()
+            if (s or s2) and self.has_traceback:
+                if self.config.highlight:
+                    if s:
                         the_return_color = self.__get_return_color(s)
                         s = Color.set(the_return_color, s)
-                        e = Color.set(the_return_color, e)
-                    last_return_color = self.config.last_return_color
-                    lastline = None
-                    try:
-                        lastline = inspect.getsourcelines(self.curframe)[0][-1]
-                        lastline = str(lastline)
-                    except Exception:
-                        lastline = ""
-                    if (
-                        last_return_color == self.config.pm_return_value_color
-                        and not self.config.exception_caught
-                        and "raise " in lastline
-                        and "(msg" in lastline.replace(" ", "")
-                    ):
-                        print(e, file=self.stdout)
-                        print(" " + s, file=self.stdout)
-                        needs_extra_line = True
-            elif "msg" in frame.f_locals or "message" in frame.f_locals:
-                s = None
-                s2 = None
-                if "msg" in frame.f_locals:
-                    s = str(frame.f_locals["msg"]).strip()
-                if "message" in frame.f_locals:
-                    s2 = str(frame.f_locals["message"]).strip()
-                if (s or s2) and self.has_traceback:
-                    if self.config.highlight:
-                        if s:
-                            the_return_color = self.__get_return_color(s)
-                            s = Color.set(the_return_color, s)
-                        if s2:
-                            the_return_color_2 = self.__get_return_color(s2)
-                            s2 = Color.set(the_return_color_2, s2)
-                    last_return_color = self.config.last_return_color
-                    lastline = None
-                    try:
-                        lastline = inspect.getsourcelines(self.curframe)[0][-1]
-                        lastline = str(lastline)
-                    except Exception:
-                        lastline = ""
-                    if (
-                        last_return_color == self.config.pm_return_value_color
-                        and not self.config.exception_caught
-                        and "raise " in lastline
-                        and s
-                        and "(msg" in lastline.replace(" ", "")
-                    ):
-                        print(s, file=self.stdout)
-                        needs_extra_line = True
-                    elif (
-                        last_return_color == self.config.pm_return_value_color
-                        and not self.config.exception_caught
-                        and "raise " in lastline
-                        and s2
-                        and "(message" in lastline.replace(" ", "")
-                    ):
-                        print(s2, file=self.stdout)
-                        needs_extra_line = True
-            if "__return__" in frame.f_locals:
-                rv = frame.f_locals["__return__"]
+                    if s2:
+                        the_return_color_2 = self.__get_return_color(s2)
+                        s2 = Color.set(the_return_color_2, s2)
+                last_return_color = self.config.last_return_color
+                lastline = None
                 try:
-                    s = repr(rv)
-                except KeyboardInterrupt:
-                    raise
+                    lastline = inspect.getsourcelines(self.curframe)[0][-1]
+                    lastline = str(lastline)
                 except Exception:
-                    s = "(unprintable return value)"
-                s = " return " + s
-                if self.config.highlight:
-                    if (
-                        needs_extra_line
-                        and frame.f_locals["__return__"] is None
-                    ):
-                        # There was an Exception. And returning None.
-                        the_return_color = self.config.exc_line_color
-                        s = s + " "
-                    else:
-                        the_return_color = self.__get_return_color(s)
-                    s = Color.set(the_return_color, s)
-                print(s, file=self.stdout)
-                needs_extra_line = True
-            if needs_extra_line:
-                print(file=self.stdout, end="\n\033[F")
+                    lastline = ""
+                if (
+                    last_return_color == self.config.pm_return_value_color
+                    and not self.config.exception_caught
+                    and "raise " in lastline
+                    and s
+                    and "(msg" in lastline.replace(" ", "")
+                ):
+                    print(s, file=self.stdout)
+                    needs_extra_line = True
+                elif (
+                    last_return_color == self.config.pm_return_value_color
+                    and not self.config.exception_caught
+                    and "raise " in lastline
+                    and s2
+                    and "(message" in lastline.replace(" ", "")
+                ):
+                    print(s2, file=self.stdout)
+                    needs_extra_line = True
+        if "__return__" in frame.f_locals:
+            rv = frame.f_locals["__return__"]
+            try:
+                with self._deadline():
+                    s = self._repr.repr(rv)
+            except KeyboardInterrupt:
+                raise
+            except Exception:
+                s = "(unprintable return value)"
+            s = " return " + s
+            if self.config.highlight:
+                if (
+                    needs_extra_line
+                    and frame.f_locals["__return__"] is None
+                ):
+                    # There was an Exception. And returning None.
+                    the_return_color = self.config.exc_line_color
+                    s = s + " "
+                else:
+                    the_return_color = self.__get_return_color(s)
+                s = Color.set(the_return_color, s)
+            print(s, file=self.stdout)
+            needs_extra_line = True
+        if needs_extra_line:
+            print(file=self.stdout, end="\n\033[F")
 
     def _format_exc_for_sticky(self, exc):
         if len(exc) != 2:
@@ -1220,13 +5190,50 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
 
     def preloop(self):
         self._print_if_sticky()
+        if self._profiler is not None:
+            self._print_profile()
+        if self._line_stats_done:
+            self._line_stats_done = False
+            if not self.sticky:
+                for line in self._line_stats.iter_report():
+                    print(line, file=self.stdout)
+        if self._thread_switched:
+            self._thread_switched = False
+            thread = threading.current_thread()
+            print(
+                "Now in thread %d (%s)."
+                % (thread_registry.get_number(thread.ident), thread.name),
+                file=self.stdout,
+            )
+        if self._task_switched:
+            self._task_switched = False
+            loop = get_running_loop()
+            task = loop and sys.modules["asyncio"].current_task(loop)
+            if task is not None:
+                print(
+                    "Now in task %d (%s)."
+                    % (self._get_task_number(task), task.get_name()),
+                    file=self.stdout,
+                )
         display_list = self._get_display_list()
         for expr, oldvalue in display_list.items():
-            newvalue = self._getval_or_undefined(expr)
-            if newvalue is not oldvalue or newvalue != oldvalue:
+            try:
+                with self._deadline():
+                    newvalue = self._getval_or_undefined(expr)
+                    changed = newvalue is not oldvalue or newvalue != oldvalue
+            except EvaluationTimeout as e:
+                print("%s: *** %s" % (expr, e), file=self.stdout)
+                continue
+            if changed:
                 display_list[expr] = newvalue
-                print("%s: %r --> %r" % (expr, oldvalue, newvalue),
-                      file=self.stdout)
+                print(
+                    "%s: %s --> %s" % (
+                        expr,
+                        self._repr.repr(oldvalue),
+                        self._repr.repr(newvalue),
+                    ),
+                    file=self.stdout,
+                )
 
     def _get_position_of_arg(self, arg):
         try:
@@ -1372,8 +5379,36 @@ class Pdb(pdb.Pdb, ConfigurableClass, object):
         if frame is None:
             frame = sys._getframe().f_back
         self._via_set_trace_frame = frame
+        if self._monitoring:
+            self._monitoring.stop()
         return super().set_trace(frame)
 
+    def break_here(self, frame):
+        """Same as Bdb.break_here(), using pdbp's effective() for logpoints."""
+        filename = self.canonic(frame.f_code.co_filename)
+        if filename not in self.breaks:
+            return False
+        lineno = frame.f_lineno
+        if lineno not in self.breaks[filename]:
+            # The line itself has no breakpoint, but maybe the line is the
+            # first line of a function with breakpoint set by function name.
+            lineno = frame.f_code.co_firstlineno
+            if lineno not in self.breaks[filename]:
+                return False
+        # flag says ok to delete temp. bp
+        (bp, flag) = effective(filename, lineno, frame)
+        if bp:
+            self.currentbp = bp.number
+            if flag and bp.temporary:
+                self.do_clear(str(bp.number))
+            return True
+        return False
+
+    def _set_stopinfo(self, *args, **kwargs):
+        super()._set_stopinfo(*args, **kwargs)
+        if self._monitoring and self._monitoring.active:
+            self._monitoring.update()
+
     def is_skipped_module(self, module_name):
         if module_name is None:
             return False
@@ -1435,23 +5470,37 @@ def post_mortem(t=None, Pdb=Pdb):
     p.interaction(None, t)
 
 
-GLOBAL_PDB = None
+GLOBAL_PDB = None  # The session of the last thread that called set_trace()
 
 
 def set_trace(frame=None, header=None, Pdb=Pdb, **kwds):
     global GLOBAL_PDB
-    if GLOBAL_PDB and hasattr(GLOBAL_PDB, "_pdbp_completing"):
+    pdb = thread_registry.get()
+    if pdb and hasattr(pdb, "_pdbp_completing"):
         return
     if frame is None:
         frame = sys._getframe().f_back
-    if GLOBAL_PDB:
-        pdb = GLOBAL_PDB
+    if pdb and getattr(pdb, "remote", None) and pdb.remote.closed:
+        pdb = None  # Detached from the broker: connect again
+    if pdb:
         sys.settrace(None)
     else:
+        # Each thread gets its own session. (Threads that never stop
+        # keep running without a trace function.)
         filename = frame.f_code.co_filename
         lineno = frame.f_lineno
-        pdb = Pdb(start_lineno=lineno, start_filename=filename, **kwds)
-        GLOBAL_PDB = pdb
+        remote = None
+        if os.environ.get("PDBP_BROKER"):
+            # A child of "python -m pdbp broker" shares its terminal.
+            remote = connect_broker(os.environ["PDBP_BROKER"])
+        if remote is not None:
+            pdb = RemotePdb(
+                remote, start_lineno=lineno, start_filename=filename, **kwds
+            )
+        else:
+            pdb = Pdb(start_lineno=lineno, start_filename=filename, **kwds)
+        thread_registry.register(pdb)
+    GLOBAL_PDB = pdb
     if header is not None:
         pdb.message(header)
     pdb.set_trace(frame)
@@ -1460,6 +5509,169 @@ def set_trace(frame=None, header=None, Pdb=Pdb, **kwds):
 def cleanup():
     global GLOBAL_PDB
     GLOBAL_PDB = None
+    thread_registry.clear()
+
+
+class RemotePdb(Pdb):
+    """A Pdb for a client of a socket ("python -m pdbp attach").
+    "quit" and a closed connection detach: this session stops tracing, and
+    the program keeps running. (The breakpoints stay, for other sessions)"""
+
+    def __init__(self, remote, **kwds):
+        self.remote = remote
+        kwds.setdefault("nosigint", True)
+        super().__init__(stdin=remote, stdout=remote, **kwds)
+
+    def interaction(self, frame, traceback):
+        # The client has its own terminal, so don't wait for the local one.
+        terminal.fixed_size = self.remote.size
+        try:
+            return self._interaction(frame, traceback)
+        finally:
+            terminal.fixed_size = None
+            self.remote.send()
+
+    def do_quit(self, arg):
+        """Detach the client, and let the program run."""
+        self.last_cmd = self.lastcmd = "quit"
+        self.breaks = {}  # So set_continue() stops tracing
+        self.set_continue()
+        self.message("Detached.")
+        self.remote.close()
+        return 1
+    do_q = do_exit = do_EOF = do_quit
+
+    def do_thread(self, arg):
+        self.error("The prompt of a remote session can't switch threads")
+
+
+def listen(address=None, frame=None, header=None, **kwds):
+    """Like set_trace(), for a client of a socket (python -m pdbp attach).
+    address is a Unix socket path or a TCP port of 127.0.0.1 (Default:
+    get_socket_path() of this process). Waits for the client for up to
+    remote_accept_timeout seconds. No thread is started."""
+    if frame is None:
+        frame = sys._getframe().f_back
+    if address is None:
+        address = get_socket_path(os.getpid())
+    remote = accept_remote(address, DefaultConfig.remote_accept_timeout)
+    if remote is None:
+        return
+    pdb = RemotePdb(
+        remote,
+        start_lineno=frame.f_lineno,
+        start_filename=frame.f_code.co_filename,
+        **kwds
+    )
+    if header is not None:
+        pdb.message(header)
+    pdb.set_trace(frame)
+
+
+def listen_on_signal(address=None, signum=None):
+    """Call listen() when the process gets signum (Default: SIGUSR2),
+    to debug the main thread wherever it is. (Eg: for "pdbp attach <pid>")
+    Nothing is opened or started until then. Call from the main thread."""
+    if signum is None:
+        signum = signal.SIGUSR2
+
+    def handler(signum, frame):
+        # The program was interrupted anywhere: an error here must not end it.
+        try:
+            listen(address, frame=frame)
+        except Exception as e:
+            print(
+                "pdbp: Can't listen (%s: %s)" % (type(e).__name__, e),
+                file=sys.stderr,
+            )
+
+    signal.signal(signum, handler)
+
+
+def attach(target):
+    """Connect the terminal to a listen() session. target is a process id
+    (which gets SIGUSR2, see listen_on_signal), a socket path, or a TCP
+    port of 127.0.0.1 (Eg: ":4444" or "localhost:4444")."""
+    import _thread
+    import socket
+    deadline = time.monotonic() + 10
+    if target.isdigit() and not os.path.exists(target):
+        pid = int(target)
+        family, address = socket.AF_UNIX, get_socket_path(pid)
+        os.kill(pid, signal.SIGUSR2)
+    else:
+        family, address = get_remote_address(target)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    while True:
+        try:
+            sock.connect(address)
+            break
+        except OSError as e:
+            # The process may not be listening yet.
+            if time.monotonic() > deadline:
+                print("pdbp: Can't attach to %s (%s)" % (target, e))
+                sys.exit(1)
+            time.sleep(0.05)
+    if sys.stdout.isatty():
+        size = tuple(shutil.get_terminal_size())
+        sock.sendall(b"pdbp attach %d %d\n" % size)
+    out = getattr(sys.stdout, "buffer", sys.stdout)
+
+    def receive():
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            out.write(data)  # A whole frame
+            out.flush()
+        _thread.interrupt_main()  # Stop reading the terminal
+
+    thread = threading.Thread(target=receive, name="pdbp-attach")
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                # EOF detaches. Then the session ends, and so does receive.
+                sock.shutdown(socket.SHUT_WR)
+                thread.join()
+                break
+            sock.sendall(line.encode("utf-8"))
+    except (KeyboardInterrupt, OSError):
+        pass
+    finally:
+        sock.close()
+    print()
+
+
+def run_broker(command):
+    """Run command (Eg: ["pytest", "-n", "4"]) with a Broker, so that the
+    breakpoints of all its processes share this terminal. Returns the exit
+    status of command. (POSIX only)"""
+    import subprocess
+    import tempfile
+    path = os.path.join(
+        tempfile.gettempdir(), "pdbp-broker-%d.sock" % os.getpid()
+    )
+    broker = Broker(path)
+    broker.listen()
+    env = dict(os.environ, PDBP_BROKER=path)
+    try:
+        # The broker reads the terminal, so the children don't.
+        process = subprocess.Popen(command, env=env, stdin=subprocess.DEVNULL)
+        while True:
+            try:
+                broker.run(process)
+                break
+            except KeyboardInterrupt:
+                pass  # The children got it too
+    finally:
+        broker.close()
+    return process.wait()
 
 
 def xpm(Pdb=Pdb):
@@ -1581,6 +5793,17 @@ def print_pdb_continue_line():
 
 def main():
     import getopt
+    if sys.argv[1:2] == ["attach"] and not os.path.exists("attach"):
+        if len(sys.argv) != 3:
+            print("usage: python -m pdbp attach <pid|socket path|[host]:port>")
+            sys.exit(2)
+        attach(sys.argv[2])
+        return
+    if sys.argv[1:2] == ["broker"] and not os.path.exists("broker"):
+        if len(sys.argv) < 3:
+            print("usage: python -m pdbp broker <command> [args...]")
+            sys.exit(2)
+        sys.exit(run_broker(sys.argv[2:]))
     opts, args = getopt.getopt(sys.argv[1:], "mhc:", ["help", "command="])
     if not args:
         print(_usage)
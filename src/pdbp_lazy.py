@@ -0,0 +1,55 @@
+"""
+pdbp_lazy: A lightweight import shim for pdbp (Pdb+).
+=====================================================
+Makes Pdb+ the debugger for breakpoint() without importing pdbp.
+(pdbp, pdb, pygments, and tabcompleter load on the first breakpoint.)
+"""
+import os
+import sys
+
+_pdbp = None
+
+
+def _load():
+    global _pdbp
+    if _pdbp is None:
+        import pdbp
+        _pdbp = pdbp
+    return _pdbp
+
+
+def set_trace(*args, **kwds):
+    if not args and kwds.get("frame") is None:
+        kwds["frame"] = sys._getframe().f_back
+    return _load().set_trace(*args, **kwds)
+
+
+def post_mortem(t=None, *args, **kwds):
+    if t is None:
+        t = sys.exc_info()[2]
+        assert t is not None, "post_mortem outside of exception context"
+    return _load().post_mortem(t, *args, **kwds)
+
+
+def xpm(*args, **kwds):
+    return _load().xpm(*args, **kwds)
+
+
+def __getattr__(name):
+    if name.startswith("__") and name.endswith("__"):
+        raise AttributeError(name)
+    return getattr(_load(), name)
+
+
+def __dir__():
+    names = list(globals().keys())
+    if _pdbp is not None:
+        names.extend(dir(_pdbp))
+    return sorted(set(names))
+
+
+if (
+    not os.environ.get("PYTHONBREAKPOINT")
+    and sys.breakpointhook is sys.__breakpointhook__
+):
+    sys.breakpointhook = set_trace
@@ -0,0 +1,45 @@
+import os
+import re
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+src_dir = os.path.abspath(src_dir)
+sys.path.insert(0, src_dir)
+ansi_escape = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+
+
+@pytest.fixture
+def run_script(tmp_path):
+    """Run a script in a new interpreter, with commands on its stdin.
+    Returns the output (stdout and stderr, without ANSI escapes), and the
+    exit status."""
+
+    def run(script, commands=(), args=(), env=None, timeout=60):
+        path = tmp_path / "script.py"
+        path.write_text(textwrap.dedent(script))
+        full_env = dict(os.environ, PYTHONPATH=src_dir)
+        full_env.pop("PYTHONBREAKPOINT", None)
+        full_env.update(env or {})
+        result = subprocess.run(
+            [sys.executable] + list(args) + [str(path)],
+            input="".join(line + "\n" for line in commands),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True, env=full_env, timeout=timeout,
+            cwd=str(tmp_path),
+        )
+        return ansi_escape.sub("", result.stdout), result.returncode
+
+    return run
+
+
+def line_of(script, text):
+    """The number of the first line of script (as run_script writes it)
+    that contains text."""
+    for lineno, line in enumerate(textwrap.dedent(script).splitlines(), 1):
+        if text in line:
+            return lineno
+    raise ValueError(text)
@@ -0,0 +1,46 @@
+from conftest import line_of
+
+script = """
+    import asyncio
+    import pdbp
+
+    async def fetch(n):
+        await asyncio.sleep(0.01)
+        return n * 2
+
+    async def main():
+        other = asyncio.create_task(fetch(5), name="fetcher")
+        pdbp.set_trace()
+        here = 0  # (Python 3.13 stops on the line of set_trace)
+        first = await fetch(1)
+        second = first + 1
+        print("result", second, await other)
+
+    asyncio.run(main())
+"""
+
+
+def test_next_steps_over_await(run_script):
+    output, status = run_script(script, [
+        "b %d" % line_of(script, "first = await"), "c", "n", "n", "p first",
+        "c",
+    ])
+    assert status == 0, output
+    assert "->     second = first + 1" in output, output
+    assert '->     print("result"' in output, output
+    assert "base_events" not in output and "tasks.py" not in output, output
+    assert "(Pdb+) 2\n" in output, output
+    assert output.rstrip().endswith("result 3 10"), output
+
+
+def test_tasks_and_await(run_script):
+    output, status = run_script(script, [
+        "tasks", "task 2", "await fetch(21)", "c",
+    ])
+    assert status == 0, output
+    assert "#  Task" in output, output
+    assert "fetcher " in output, output
+    assert "Task 2 (fetcher)" in output, output
+    assert "script.py(5)fetch()" in output, output
+    assert "(Pdb+) 42\n" in output, output
+    assert output.rstrip().endswith("result 3 10"), output
@@ -0,0 +1,138 @@
+import io
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+import pdbp
+from conftest import ansi_escape, src_dir
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="POSIX only"
+)
+
+
+class Program(object):
+    """Stands for the Popen of the command of the broker."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+    def poll(self):
+        return 0 if self.done.is_set() else None
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_broker_sessions(tmp_path):
+    path = str(tmp_path / "broker.sock")
+    read_fd, write_fd = os.pipe()
+    stdout = io.BytesIO()
+    with os.fdopen(read_fd) as stdin:
+        broker = pdbp.Broker(path, stdin=stdin, stdout=stdout)
+        broker.listen()
+        program = Program()
+        thread = threading.Thread(target=broker.run, args=(program,))
+        thread.start()
+        try:
+            # Not a session: dropped, and the broker keeps serving.
+            stranger = socket.socket(socket.AF_UNIX)
+            stranger.connect(path)
+            stranger.sendall(b"hello\n")
+            stranger.settimeout(10)
+            assert stranger.recv(100).startswith(b"pdbp attach ")
+            assert stranger.recv(100) == b""  # Closed by the broker
+            stranger.close()
+
+            client = socket.socket(socket.AF_UNIX)
+            client.connect(path)
+            client.settimeout(10)
+            reader = client.makefile("rb")
+            assert reader.readline().startswith(b"pdbp attach ")
+            client.sendall(b"pdbp session 123 worker\n")
+            client.sendall(broker.frame(broker.output_frame, b"a\0b\n"))
+            wait_for(lambda: broker.sessions)
+            session = broker.sessions[1]
+            assert session.label == "pid 123 (worker)"
+            time.sleep(0.1)
+            assert not session.waiting  # A NUL is only output
+            client.sendall(
+                broker.frame(broker.output_frame, b"(Pdb+) ")
+                + broker.frame(broker.prompt_frame)
+            )
+            wait_for(lambda: session.waiting)
+            wait_for(lambda: b"(Pdb+) " in stdout.getvalue())
+            assert b"a\0b\n" in stdout.getvalue()
+            os.write(write_fd, b"next\n")
+            assert reader.readline() == b"next\n"
+            reader.close()
+            client.close()
+        finally:
+            program.done.set()
+            thread.join(10)
+            os.close(write_fd)
+            broker.close()
+    assert "Session 1 ended." in stdout.getvalue().decode()
+
+
+pool_script = """
+    import multiprocessing
+    import pdbp
+
+    def work(n):
+        value = n * 10
+        pdbp.set_trace()
+        return value + 1
+
+    if __name__ == "__main__":
+        with multiprocessing.Pool(2) as pool:
+            print("results", pool.map(work, [1, 2]))
+"""
+
+
+def test_broker_shares_the_terminal(tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text(textwrap.dedent(pool_script))
+    broker = subprocess.Popen(
+        [sys.executable, "-m", "pdbp", "broker", sys.executable, str(script)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, env=dict(os.environ, PYTHONPATH=src_dir),
+    )
+    chunks = []
+    reader = threading.Thread(
+        target=lambda: chunks.extend(iter(
+            lambda: broker.stdout.read1(65536), b""
+        ))
+    )
+    reader.start()
+
+    def output():
+        return ansi_escape.sub("", b"".join(chunks).decode())
+
+    try:
+        for number in (1, 2):
+            wait_for(lambda: (
+                output().count("script.py(") >= number
+                and output().endswith("(Pdb+) ")
+            ), 30)
+            broker.stdin.write(b"p value\nc\n")
+            broker.stdin.flush()
+        wait_for(lambda: "results" in output(), 30)
+        broker.stdin.close()
+        assert broker.wait(30) == 0
+    finally:
+        broker.kill()
+        reader.join()
+    text = output()
+    assert "(Pdb+) 10\n" in text and "(Pdb+) 20\n" in text, text
+    assert "results [11, 21]" in text, text
@@ -0,0 +1,67 @@
+import sys
+
+import pdbp
+
+
+def get_index(f_locals):
+    frame = sys._getframe()
+    return frame, pdbp.CompletionIndex(frame, f_locals)
+
+
+def test_index_matches_prefixes():
+    frame, index = get_index({"alpha": 1, "alps": 2, "beta": 3})
+    assert index.matches("alp") == ["alpha", "alps"]
+    assert "print" in index.matches("pri")
+
+
+def test_index_is_rebuilt_after_a_statement():
+    debugger = pdbp.Pdb()
+    frame = sys._getframe()
+    debugger.curframe = frame
+    debugger.curframe_locals = frame.f_locals
+    index = debugger._get_completer().index
+    assert debugger._get_completer().index is index  # Kept between Tabs
+    assert index.matches("completion_test_") == []
+    debugger.default("import json as completion_test_json")
+    index = debugger._get_completer().index
+    assert index.matches("completion_test_") == ["completion_test_json"]
+    debugger.reset()
+    debugger.setup(frame, None)  # A new stop
+    assert debugger._get_completer().index is not index
+
+
+class Spy(object):
+    calls = 0
+
+    def __getitem__(self, key):
+        Spy.calls += 1
+        return self
+
+    @property
+    def prop(self):
+        Spy.calls += 1
+        return self
+
+    def method(self):
+        pass
+
+
+def get_completer(f_locals, safe=True):
+    frame, index = get_index(f_locals)
+    return pdbp.PdbCompleter(index, safe=safe)
+
+
+def test_safe_completion_runs_no_code():
+    Spy.calls = 0
+    completer = get_completer({"spy": Spy()})
+    assert completer.attr_matches("spy.meth") == ["spy.method"]
+    assert completer.attr_matches("spy[0].meth") == []
+    assert completer.attr_matches("spy.prop.meth") == []
+    assert Spy.calls == 0
+
+
+def test_unsafe_completion_evaluates():
+    Spy.calls = 0
+    completer = get_completer({"spy": Spy()}, safe=False)
+    assert completer.attr_matches("spy[0].meth") == ["spy[0].method"]
+    assert Spy.calls == 1
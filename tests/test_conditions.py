@@ -0,0 +1,43 @@
+import pdbp
+
+script = """
+    import pdbp
+
+    def f():
+        pdbp.set_trace()
+        total = 0
+        for i in range(10):
+            total += i
+        return total
+
+    f()
+"""
+
+
+def test_condition_stops_once_and_keeps_stats(run_script):
+    output, status = run_script(script, [
+        "sticky", "break 8, i == 7", "c", "p i", "break", "c",
+    ])
+    assert status == 0, output
+    assert "(Pdb+) 7\n" in output, output
+    assert "stop only if i == 7" in output
+    assert "breakpoint already hit 8 times" in output
+    assert "condition evaluated 8 times" in output
+    assert "fired 1 time" in output
+
+
+def test_plain_breakpoint_with_ignore_count(run_script):
+    output, status = run_script(script, [
+        "sticky", "break 8", "ignore 1 3", "c", "p i", "break", "cl 1", "c",
+    ])
+    assert status == 0, output
+    assert "(Pdb+) 3\n" in output, output
+    assert "breakpoint already hit 4 times" in output, output
+    assert "fired 1 time" in output, output
+    assert "condition evaluated" not in output, output
+
+
+def test_condition_is_compiled_once():
+    co = pdbp.get_condition_code("x > 1")
+    assert pdbp.get_condition_code("x > 1") is co
+    assert eval(co, {"x": 2}) is True
@@ -0,0 +1,25 @@
+import time
+
+script = """
+    import time
+    import pdbp
+    pdbp.DefaultConfig.eval_timeout = 0.5
+
+    def spin():
+        while True:
+            pass
+
+    pdbp.set_trace()
+    x = 1
+"""
+
+
+def test_deadline_stops_long_evaluations(run_script):
+    start = time.monotonic()
+    output, status = run_script(script, [
+        "p spin()", "p time.sleep(30)", "p 1 + 1", "c",
+    ])
+    assert time.monotonic() - start < 15
+    assert status == 0, output
+    assert output.count("EvaluationTimeout: The evaluation took longer") == 2
+    assert "(Pdb+) 2\n" in output, output
@@ -0,0 +1,28 @@
+def test_lazy_import_does_not_load_pdbp(run_script):
+    output, status = run_script("""
+        import sys, pdbp_lazy
+        assert "pdbp" not in sys.modules
+        assert "pdb" not in sys.modules
+        assert sys.breakpointhook is pdbp_lazy.set_trace
+        print("ok")
+    """)
+    assert (output.strip(), status) == ("ok", 0), output
+
+
+def test_lazy_breakpoint_loads_pdbp(run_script):
+    output, status = run_script("""
+        import sys, pdbp_lazy
+        breakpoint()
+        assert "pdbp" in sys.modules
+        print("ok")
+    """, ["c"])
+    assert "(Pdb+)" in output
+    assert output.rstrip().endswith("ok"), output
+
+
+def test_lazy_keeps_pythonbreakpoint(run_script):
+    output, status = run_script("""
+        import sys, pdbp_lazy
+        print(sys.breakpointhook is sys.__breakpointhook__)
+    """, env={"PYTHONBREAKPOINT": "0"})
+    assert output.strip() == "True", output
@@ -0,0 +1,51 @@
+import bdb
+import re
+import sys
+
+import pdbp
+
+script = """
+    import pdbp
+
+    def square(n):
+        return n * n
+
+    def work(depth):
+        if depth:
+            return work(depth - 1)
+        pdbp.set_trace()
+        total = 0
+        for i in range(1000):
+            total += square(i)
+        return total
+
+    work(2)
+    print("done")
+"""
+
+
+def test_linestat_counts_the_lines_of_the_function(run_script):
+    # Before Python 3.12, this goes through sys.settrace.
+    output, status = run_script(script, ["linestat", "linestat show", "c"])
+    assert status == 0, output
+    assert "--Return--" in output, output
+    assert re.search(r"\n +13 +1000 .*total \+= square\(i\)", output), output
+    assert re.search(r"\n +12 +1001 .*for i in range", output), output
+    # Other functions (and other calls of work()) are not counted.
+    assert not re.search(r"\n +\d+ +\d+ .*return n \* n", output), output
+    assert not re.search(r"\n +\d+ +\d+ .*if depth:", output), output
+    assert output.rstrip().endswith("done"), output
+
+
+def test_trace_hooks_are_only_installed_while_counting():
+    debugger = pdbp.Pdb()
+    for name in pdbp.Pdb.trace_hooks:
+        assert getattr(pdbp.Pdb, name) is getattr(bdb.Bdb, name)
+    assert not set(pdbp.Pdb.trace_hooks) & set(vars(debugger))
+    debugger._line_stats = pdbp.LineStats(sys._getframe().f_code)
+    debugger._line_stats.active = True  # (What start() does before 3.12)
+    debugger._update_trace_hooks()
+    assert debugger.dispatch_line == debugger._hooked_dispatch_line
+    debugger._line_stats.active = False
+    debugger._update_trace_hooks()
+    assert not set(pdbp.Pdb.trace_hooks) & set(vars(debugger))
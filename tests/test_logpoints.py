@@ -0,0 +1,32 @@
+script = """
+    import pdbp
+
+    def f():
+        pdbp.set_trace()
+        total = 0
+        for i in range(3):
+            total += i
+        return total
+
+    f()
+    print("done")
+"""
+
+
+def test_logpoint_logs_without_stopping(run_script):
+    output, status = run_script(script, ["sticky", "logpoint 8 i, total", "c"])
+    assert status == 0, output
+    assert "Logpoint 1 at " in output
+    assert output.count("(Pdb+)") == 3, output  # No stop at line 8
+    for i, total in ((0, 0), (1, 0), (2, 1)):
+        assert "#1 script.py:8 i=%d, total=%d" % (i, total) in output
+
+
+def test_logs_shows_recent_records(run_script):
+    output, status = run_script(script, [
+        "sticky", "logpoint 8 i", "break 9", "c", "logs 2", "c",
+    ])
+    assert status == 0, output
+    logs = output.split("(Pdb+)")[-2]
+    assert "i=0" not in logs
+    assert "i=1" in logs and "i=2" in logs, output
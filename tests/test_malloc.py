@@ -0,0 +1,56 @@
+import pdbp
+from conftest import line_of
+
+script = """
+    import re
+    import pdbp
+
+    def work():
+        patterns = [re.compile("user_pattern_%d" % i) for i in range(50)]
+        data = [bytearray(1000) for _ in range(100)]
+        return patterns, data
+
+    pdbp.set_trace()
+    result = work()
+    x = 1
+"""
+
+
+def test_filter_drops_debugger_tracebacks():
+    trace_filter = pdbp.DebuggerTraceFilter(
+        frozenset(["pdbp.py", "bdb.py"]), {("pdbp.py", 10)}
+    )
+    user = (0, 100, (("re.py", 1), ("app.py", 2)), 2)
+    debugger = (0, 100, (("re.py", 1), ("pdbp.py", 20), ("app.py", 2)), 3)
+    launched = (0, 100, (("re.py", 1), ("app.py", 2), ("pdbp.py", 10)), 3)
+    assert trace_filter._match(user)
+    assert not trace_filter._match(debugger)
+    assert trace_filter._match(launched)
+
+
+def check_diff(output):
+    diff = output.split("Top 5 changes")[1].split("(Pdb+)")[0]
+    data = "script.py:%d  data = [bytearray(1000)" % line_of(script, "data")
+    assert data in diff, output
+    assert "_compile" in diff  # The program's re.compile()
+    assert "pdbp.py" not in diff
+
+
+def test_malloc_diff_keeps_stdlib_calls_of_the_program(run_script):
+    output, status = run_script(script, [
+        "malloc start", "b %d" % line_of(script, "x = 1"), "c",
+        "malloc diff 5", "where", "n", "malloc diff", "c",
+    ])
+    assert status == 0, output
+    check_diff(output)
+    assert "Top 10 changes since the previous stop (+0 bytes" in output
+
+
+def test_malloc_under_python_m_pdbp(run_script):
+    output, status = run_script(
+        script.replace("pdbp.set_trace()", "pass"),
+        ["malloc start", "b %d" % line_of(script, "x = 1"), "c",
+         "malloc diff 5", "c"],
+        args=["-m", "pdbp"],
+    )
+    check_diff(output)
@@ -0,0 +1,85 @@
+import gc
+import weakref
+
+import pdbp
+
+
+class Node(object):
+    pass
+
+
+def test_sizes_follow_in_place_changes():
+    deep_size = pdbp.DeepSize()
+    obj = ["x" * 10, "y" * 10]
+    (size, count, complete, _), = deep_size.measure([obj])
+    assert complete and count == 3
+    obj[0] = "z" * 1000000  # Same length
+    (new_size, _, _, reused), = deep_size.measure([obj])
+    assert new_size - size > 990000 and not reused
+
+
+def test_immutable_tuples_are_reused():
+    deep_size = pdbp.DeepSize()
+    frozen = tuple(("x" * i, i) for i in range(1000))
+    first = deep_size.measure([frozen])[0]
+    assert not first[3]
+    assert deep_size.measure([frozen])[0] == first[:3] + (True,)
+    assert not deep_size.measure([frozen], recount=True)[0][3]
+    # A list inside can change, so it's measured again.
+    thawed = (["x"], 1)
+    deep_size.measure([thawed])
+    thawed[0].append("y" * 1000)
+    size, _, _, reused = deep_size.measure([thawed])[0]
+    assert not reused and size > 1000
+
+
+def test_reused_entries_need_the_same_object():
+    deep_size = pdbp.DeepSize()
+    frozen = (1, 2, 3)
+    deep_size.measure([frozen])
+    guard, size, count = deep_size.cache[id(frozen)]
+    # A new object at the same address would differ in type, length or hash
+    deep_size.cache[id(frozen)] = ((tuple, 3, hash((1, 2, 4))), 1, 1)
+    assert deep_size.measure([frozen])[0] == (size, count, True, False)
+
+
+def test_measured_objects_are_not_kept_alive():
+    deep_size = pdbp.DeepSize()
+    obj = Node()
+    obj.data = list(range(1000))
+    ref = weakref.ref(obj)
+    deep_size.measure([obj])
+    del obj
+    gc.collect()
+    assert ref() is None
+
+
+def test_excluded_objects_are_not_traversed():
+    deep_size = pdbp.DeepSize()
+    shared = list(range(1000))
+    holder = [shared]
+    results = deep_size.measure([shared, holder], exclude=(shared,))
+    assert results[0] == (0, 0, True, False)
+    assert results[1][1] == 1  # Only the holder
+
+
+def test_budget_marks_partial_results():
+    deep_size = pdbp.DeepSize(max_objects=10)
+    size, count, complete, _ = deep_size.measure([list(range(1000))])[0]
+    assert not complete and count <= 10
+
+
+def test_mem_command(run_script):
+    output, status = run_script("""
+        import pdbp
+        big = ["x" * 100000 for _ in range(10)]
+        small = 1
+        frozen = tuple(range(1000))
+        pdbp.set_trace()
+        pass
+    """, ["mem", "mem", "mem!", "c"])
+    assert status == 0, output
+    rows = [line.split() for line in output.splitlines()]
+    names = [row[0] for row in rows if row and row[0] in ("big", "small")]
+    assert names[:2] == ["big", "small"], output  # Biggest first
+    assert output.count(", 1 reused)") == 1, output  # frozen
@@ -0,0 +1,35 @@
+import sys
+
+import pytest
+
+script = """
+    import pdbp
+    pdbp.DefaultConfig.trace_backend = %r
+
+    def f():
+        pdbp.set_trace()
+        total = 0
+        for i in range(1000):
+            total += i
+        return total
+
+    f()
+    print("done")
+"""
+
+
+def run_loop(run_script, backend):
+    return run_script(script % backend, [
+        "sticky", "break 9, i == 500", "c", "p total", "n", "n", "p i", "c",
+    ])
+
+
+@pytest.mark.parametrize("backend", ["settrace", "monitoring"])
+def test_break_next_and_continue(run_script, backend):
+    if backend == "monitoring" and not hasattr(sys, "monitoring"):
+        pytest.skip("sys.monitoring needs Python 3.12+")
+    output, status = run_loop(run_script, backend)
+    assert status == 0, output
+    assert "(Pdb+) 124750\n" in output, output  # sum(range(500))
+    assert "(Pdb+) 501\n" in output, output
+    assert output.rstrip().endswith("done"), output
@@ -0,0 +1,28 @@
+import time
+
+script = """
+    import time
+    import pdbp
+
+    def spin(seconds):
+        start = time.time()
+        while time.time() - start < seconds:
+            pass
+
+    pdbp.set_trace()
+    for i in range(3):
+        spin(0.6)
+        time.sleep(0.6)
+"""
+
+
+def test_profile_stops_after_the_deadline(run_script):
+    start = time.monotonic()
+    output, status = run_script(script, ["profile 1", "p i", "c"])
+    assert time.monotonic() - start < 15
+    assert status == 0, output
+    assert "Profile finished." in output, output
+    assert "spin (" in output, output
+    assert "time.sleep(0.6)" in output, output
+    # It stopped in the first iterations, not at the end of the program
+    assert "(Pdb+) 0\n" in output or "(Pdb+) 1\n" in output, output
@@ -0,0 +1,25 @@
+script = """
+    import pdbp
+
+    class Box(object):
+        pass
+
+    box = Box()
+    holder = {"key": [box]}
+    pdbp.set_trace()
+    pass
+"""
+
+
+def test_referrers_shows_paths(run_script):
+    output, status = run_script(script, ["referrers box", "c"])
+    assert status == 0, output
+    assert "<module>():box\n" in output
+    assert "<module>():holder['key'][0]\n" in output
+
+
+def test_refs_shows_a_tree(run_script):
+    output, status = run_script(script, ["refs 3 holder", "c"])
+    assert status == 0, output
+    assert "    ['key']  list  " in output
+    assert "        [0]  Box  <__main__.Box object at " in output
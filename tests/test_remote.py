@@ -0,0 +1,102 @@
+import os
+import socket
+import stat
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+import pdbp
+from conftest import ansi_escape, src_dir
+
+signal_script = """
+    import os
+    import signal
+    import pdbp
+
+    pdbp.listen_on_signal()
+    with open(pdbp.get_socket_path(os.getpid()), "w") as f:
+        f.write("Not a socket")
+    os.kill(os.getpid(), signal.SIGUSR2)
+    print("still running")
+"""
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="POSIX only")
+def test_signal_handler_errors_dont_end_the_program(run_script, tmp_path):
+    output, status = run_script(signal_script, env={"TMPDIR": str(tmp_path)})
+    assert status == 0, output
+    assert "pdbp: Can't listen (" in output, output
+    assert output.rstrip().endswith("still running"), output
+
+
+def test_other_hosts_are_refused():
+    with pytest.raises(ValueError, match="remote_any_host"):
+        pdbp.accept_remote("0.0.0.0:0", 1)
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="POSIX only")
+def test_unix_socket_is_private(tmp_path):
+    path = str(tmp_path / "debug.sock")
+    modes = []
+
+    def connect():
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        modes.append(stat.S_IMODE(os.stat(path).st_mode))
+        client = socket.socket(socket.AF_UNIX)
+        client.connect(path)
+        client.close()
+
+    thread = threading.Thread(target=connect)
+    thread.start()
+    remote = pdbp.accept_remote(path, 10)
+    thread.join()
+    remote.close()
+    assert modes and not modes[0] & 0o077, oct(modes[0])
+
+
+attach_script = """
+    import bdb
+    import sys
+    import pdbp
+
+    def add_one(n):
+        return n + 1
+
+    pdbp.listen(sys.argv[1])
+    x = add_one(1)
+    print("x =", x)
+    breakpoints = [bp for bp in bdb.Breakpoint.bpbynumber if bp is not None]
+    print("breakpoints:", len(breakpoints))
+"""
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="POSIX only")
+def test_attach_and_detach(tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text(textwrap.dedent(attach_script))
+    path = str(tmp_path / "debug.sock")
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    program = subprocess.Popen(
+        [sys.executable, str(script), path],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True, env=env,
+    )
+    client = subprocess.run(
+        [sys.executable, "-m", "pdbp", "attach", path],
+        input="break add_one\nc\np n\nquit\n",
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True, env=env, timeout=60,
+    )
+    output = ansi_escape.sub("", program.communicate(timeout=60)[0])
+    session = ansi_escape.sub("", client.stdout)
+    assert program.returncode == 0, output
+    assert "Breakpoint 1 at " in session, session
+    assert "(Pdb+) 1\n" in session, session
+    assert "Detached." in session, session
+    # The program runs on, and the breakpoint stays for other sessions.
+    assert "x = 2\nbreakpoints: 1" in output, output
@@ -0,0 +1,65 @@
+import io
+
+import pytest
+
+import pdbp
+
+
+class FakeTerminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+@pytest.fixture
+def terminal(monkeypatch):
+    monkeypatch.setattr(pdbp.terminal, "fixed_size", (80, 24))
+    return FakeTerminal()
+
+
+def get_frame(current):
+    rows = ["%4d  %2s line %d" % (i, "->" if i == current else "", i)
+            for i in range(1, 6)]
+    return pdbp.CLEARSCREEN + "\n".join(rows) + "\n\n\033[F"
+
+
+def test_first_frame_is_fully_painted(terminal):
+    renderer = pdbp.FrameRenderer()
+    renderer.render(terminal, get_frame(1))
+    assert terminal.getvalue() == get_frame(1)
+
+
+def test_next_frame_only_sends_changed_rows(terminal):
+    renderer = pdbp.FrameRenderer()
+    renderer.render(terminal, get_frame(1))
+    terminal.seek(0)
+    terminal.truncate()
+    renderer.render(terminal, get_frame(2))
+    out = terminal.getvalue()
+    assert pdbp.CLEARSCREEN not in out
+    assert "\033[1;1H" in out and "\033[2;1H" in out
+    assert "\033[3;1H" not in out  # Unchanged
+    assert len(out) < len(get_frame(2))
+
+
+def test_not_a_terminal_is_unchanged():
+    stream = io.StringIO()
+    renderer = pdbp.FrameRenderer()
+    renderer.render(stream, get_frame(1))
+    renderer.render(stream, get_frame(2))
+    assert stream.getvalue() == get_frame(1) + get_frame(2)
+
+
+@pytest.mark.parametrize("command", ["n", "step", "return", "until", "j 3"])
+def test_commands_that_resume_repaint_the_frame(command):
+    debugger = pdbp.Pdb()
+    debugger._renderer.rows = ["row", None]
+    debugger.precmd(command)
+    assert debugger._renderer.rows is None
+
+
+@pytest.mark.parametrize("command", ["u", "down", "ll", "truncate"])
+def test_moves_in_the_stack_redraw_rows(command):
+    debugger = pdbp.Pdb()
+    debugger._renderer.rows = ["row", None]
+    debugger.precmd(command)
+    assert debugger._renderer.rows == ["row", None]
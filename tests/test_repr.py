@@ -0,0 +1,84 @@
+import collections
+
+import pytest
+
+import pdbp
+
+
+@pytest.fixture
+def bounded():
+    return pdbp.BoundedRepr(maxitems=5, maxstring=20)
+
+
+def test_small_objects_use_repr(bounded):
+    obj = {"a": [1, 2], "b": (3,)}
+    assert bounded.repr(obj) == repr(obj)
+    counter = collections.Counter("ab")
+    assert bounded.repr(counter) == repr(counter)
+
+
+def test_large_containers_are_bounded(bounded):
+    assert bounded.repr(list(range(100))) == "[0, 1, 2, 3, 4, … (95 more)]"
+    assert bounded.repr("x" * 30) == "'xxxxxxxxxxxxxxxxxxxx'… (10 more)"
+
+
+@pytest.mark.parametrize("obj", [
+    collections.defaultdict(int, ((i, i) for i in range(200000))),
+    collections.OrderedDict((i, i) for i in range(200000)),
+    collections.Counter(range(200000)),
+    collections.deque(range(200000)),
+    [collections.Counter(range(200000))],
+])
+def test_large_subclassed_containers_are_bounded(bounded, obj):
+    text = bounded.repr(obj)
+    assert len(text) < 100, text
+    assert "(199995 more)" in text
+
+
+def test_pformat_of_large_subclass(bounded):
+    obj = collections.defaultdict(list, ((i, [i]) for i in range(1000)))
+    lines = "".join(bounded.iter_pformat(obj, 20)).splitlines()
+    assert lines[0] == "defaultdict({0: [0],"
+    assert lines[-1].strip() == "… (995 more)})"
+
+
+def test_p_bounds_a_large_defaultdict(run_script):
+    output, status = run_script("""
+        import collections
+        import pdbp
+        d = collections.defaultdict(int)
+        d.update((i, i) for i in range(200000))
+        pdbp.set_trace()
+        pass
+    """, ["p d", "c"])
+    assert status == 0, output
+    assert "… (199900 more)})" in output
+    assert len(output) < 5000
+
+
+def test_p_bounds_a_long_repr(run_script):
+    output, status = run_script("""
+        import pdbp
+
+        class Blob(object):
+            def __repr__(self):
+                return "x" * 400000
+
+        blob = Blob()
+        pdbp.set_trace()
+        pass
+    """, ["p blob", "pp blob", "pp [blob]", "p! len(repr(blob))", "c"])
+    assert status == 0, output
+    assert output.count("(380000 more)") == 1, output  # p
+    assert output.count("… (output truncated)") == 2, output  # pp
+    assert "(Pdb+) 400000\n" in output, output
+    assert len(output) < 100000, len(output)
+
+
+def test_import_with_optimize_2(run_script):
+    # Docstrings are None under -OO.
+    output, status = run_script("""
+        import pdbp
+        print("ok")
+    """, args=["-OO"])
+    assert (output.strip(), status) == ("ok", 0), output
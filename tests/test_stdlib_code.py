@@ -0,0 +1,27 @@
+import os
+
+import pdbp
+
+
+def get_pdb_file():
+    return os.path.join(os.path.dirname(pdbp.code.__file__), "pdb.py")
+
+
+def test_stdlib_code_matches_source():
+    pyfile = get_pdb_file()
+    with open(pyfile) as f:
+        compiled = compile(f.read(), pyfile, "exec", dont_inherit=True)
+    co_module = pdbp.get_stdlib_code("pdb", pyfile)
+    assert co_module.co_filename == pyfile
+    assert co_module.co_names == compiled.co_names
+
+
+def test_stdlib_code_falls_back_to_compile(monkeypatch):
+    def get_code(self, name):
+        raise ImportError("no cache")
+
+    monkeypatch.setattr(
+        pdbp.importlib.machinery.SourceFileLoader, "get_code", get_code
+    )
+    co_module = pdbp.get_stdlib_code("pdb", get_pdb_file())
+    assert "Pdb" in co_module.co_names
@@ -0,0 +1,28 @@
+def test_highlight_cache_reused_while_stepping(run_script):
+    output, status = run_script("""
+        import pdbp
+
+        def f():
+            pdbp.set_trace()
+            a = 1
+            b = 2
+            return a + b
+
+        f()
+    """, [
+        "n", "n",
+        "p len(pdbp.GLOBAL_PDB._highlight_cache)",
+        "c",
+    ])
+    assert status == 0, output
+    assert "(Pdb+) 1\n" in output, output
+
+
+def test_lru_cache_evicts_oldest():
+    import pdbp
+    cache = pdbp.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert list(cache) == ["a", "c"]
@@ -0,0 +1,36 @@
+import pytest
+
+import pdbp
+
+np = pytest.importorskip("numpy")
+
+
+def test_wide_array_is_sampled():
+    arr = np.arange(6000000, dtype=float).reshape(2, 3000000)
+    data = pdbp.summarize_ndarray(arr, 100000, np)
+    assert data["Sample"] == "Every 60th element (100000 of 6000000 elements)"
+    assert data["Min"] == "0"
+    assert float(data["Max"]) >= 5999000
+
+
+def test_small_array_is_not_sampled():
+    arr = np.array([[1.0, np.nan], [3.0, 4.0]])
+    data = pdbp.summarize_ndarray(arr, 100000, np)
+    assert "Sample" not in data
+    assert (data["Nulls"], data["Min"], data["Max"]) == (1, "1", "4")
+
+
+@pytest.mark.parametrize("n, text", [
+    (1, "1st"), (2, "2nd"), (3, "3rd"), (4, "4th"), (11, "11th"),
+    (12, "12th"), (13, "13th"), (21, "21st"), (102, "102nd"),
+])
+def test_ordinal(n, text):
+    assert pdbp.ordinal(n) == text
+
+
+def test_wide_frame_is_bounded():
+    pd = pytest.importorskip("pandas")
+    frame = pd.DataFrame(np.ones((1000, 500)))
+    data = pdbp.summarize_pandas(frame, 1000, pd)
+    assert data["Sample"] == "Every 20th row (50 of 1000 rows)"
+    assert data["Columns"].endswith("… (480 more columns)")
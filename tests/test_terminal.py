@@ -0,0 +1,46 @@
+import os
+import signal
+
+import pytest
+
+import pdbp
+
+
+def test_size_is_queried_once(monkeypatch):
+    calls = []
+    geometry = pdbp.TerminalGeometry()
+
+    def query():
+        calls.append(1)
+        return os.terminal_size((90, 30))
+
+    monkeypatch.setattr(geometry, "query", query)
+    assert geometry.get() == (90, 30)
+    assert geometry.get() == (90, 30)
+    assert len(calls) == 1
+
+
+@pytest.mark.skipif(
+    not hasattr(signal, "SIGWINCH"), reason="needs SIGWINCH"
+)
+def test_sigwinch_drops_the_cached_size(monkeypatch):
+    previous = signal.getsignal(signal.SIGWINCH)
+    sizes = iter([(90, 30), (120, 40)])
+    geometry = pdbp.TerminalGeometry()
+    monkeypatch.setattr(
+        geometry, "query", lambda: os.terminal_size(next(sizes))
+    )
+    try:
+        geometry.refresh()
+        assert geometry.watching
+        assert geometry.get() == (90, 30)
+        os.kill(os.getpid(), signal.SIGWINCH)
+        assert geometry.get() == (120, 40)
+    finally:
+        signal.signal(signal.SIGWINCH, previous)
+
+
+def test_fixed_size_wins():
+    geometry = pdbp.TerminalGeometry()
+    geometry.fixed_size = os.terminal_size((50, 10))
+    assert geometry.get() == (50, 10)
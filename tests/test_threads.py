@@ -0,0 +1,73 @@
+script = """
+    import sys
+    import threading
+    import time
+    import pdbp
+
+    barrier = threading.Barrier(2)
+    traced = []
+
+    def worker(n):
+        value = n * 10
+        barrier.wait()
+        pdbp.set_trace()
+        result = value + 1
+        return result
+
+    def bystander():
+        time.sleep(1.5)
+        traced.append(sys.gettrace())
+
+    workers = [
+        threading.Thread(target=worker, args=(n,), name="worker-%d" % n)
+        for n in (1, 2)
+    ]
+    other = threading.Thread(target=bystander, name="bystander")
+    for t in workers + [other]:
+        t.start()
+    for t in workers + [other]:
+        t.join()
+    print("traced:", traced)
+"""
+
+
+def test_each_thread_gets_its_own_session(run_script):
+    output, status = run_script(script, [
+        "!time.sleep(0.5)",  # Let the other worker stop too
+        "threads", "p value", "thread 2", "p value", "c", "c",
+    ])
+    assert status == 0, output
+    assert "#  Thread" in output, output
+    assert "prompt   " in output and "stopped  " in output, output
+    assert "Now in thread 2 (worker-" in output, output
+    assert "(Pdb+) 10\n" in output and "(Pdb+) 20\n" in output, output
+    # Threads that are not debugged run without a trace function.
+    assert output.rstrip().endswith("traced: [None]"), output
+
+
+stacks_script = """
+    import queue
+    import threading
+    import time
+    import pdbp
+
+    jobs = queue.Queue()
+    pool = [threading.Thread(target=jobs.get) for _ in range(40)]
+    for t in pool:
+        t.start()
+    pdbp.set_trace()
+    for t in pool:
+        jobs.put(None)
+    for t in pool:
+        t.join()
+    print("done")
+"""
+
+
+def test_threads_bt_groups_identical_stacks(run_script):
+    output, status = run_script(stacks_script, ["threads bt", "c"])
+    assert status == 0, output
+    assert "40 threads blocked in queue.get: " in output, output
+    assert "+32 more" in output, output
+    assert "* Thread 1 (MainThread) in __main__.<module>" in output, output
+    assert output.rstrip().endswith("done"), output
@@ -0,0 +1,67 @@
+import os
+import re
+
+import pytest
+
+import pdbp
+
+ansi = re.compile(r"\x1b\[[0-9;]*m")
+source = "\n".join([
+    "def f(x):",
+    "    y = 'a long string that does not fit in a narrow terminal'",
+    "    return x + y  # 中文 comment",
+])
+
+
+def get_pdb(tmp_path):
+    class Config(pdbp.DefaultConfig):
+        token_cache = True
+        token_cache_dir = str(tmp_path)
+        token_cache_min_length = 0
+        highlight = True
+
+    return pdbp.Pdb(Config=Config)
+
+
+def test_fit_tokens_trims_and_pads():
+    pytest.importorskip("pygments")
+    from pygments.lexers import PythonLexer
+    tokens = pdbp.fit_tokens(PythonLexer().get_tokens(source), 20)
+    lines = "".join(value for _, value in tokens).splitlines()
+    assert [pdbp.get_width(line) for line in lines] == [20, 20, 20]
+    assert lines[0] == "def f(x):".ljust(20)
+
+
+def test_token_cache_does_not_depend_on_width(tmp_path):
+    pdb = get_pdb(tmp_path)
+    narrow = pdb.format_source(source, width=30)
+    wide = pdb.format_source(source, width=60)
+    assert len(os.listdir(str(tmp_path))) == 1
+    for text, width in ((narrow, 30), (wide, 60)):
+        lines = ansi.sub("", text).splitlines()
+        expected = [
+            pdbp.set_line_width(line, width) for line in source.split("\n")
+        ]
+        assert lines == expected
+
+
+def test_token_cache_is_keyed_on_the_source(tmp_path):
+    pytest.importorskip("pygments")
+    pdb = get_pdb(tmp_path)
+    pdb.format_source(source)
+    # Same length (Eg: a file changed within the mtime resolution)
+    changed = source.replace("return x + y", "return y + x")
+    assert "y + x" in ansi.sub("", pdb.format_source(changed))
+    assert len(os.listdir(str(tmp_path))) == 2
+    pdb.format_source(source)
+    assert len(os.listdir(str(tmp_path))) == 2
+
+
+def test_token_cache_is_keyed_on_the_style(tmp_path):
+    pytest.importorskip("pygments")
+    from pygments.lexers import PythonLexer
+    lexer = PythonLexer()
+    for style in ("dark", "light", "dark"):
+        cache = pdbp.TokenCache(str(tmp_path), 1 << 20, style=style)
+        cache.get_tokens(source, lexer)
+    assert len(os.listdir(str(tmp_path))) == 2
@@ -0,0 +1,28 @@
+import pdbp
+
+
+def test_get_width():
+    assert pdbp.get_width("abc") == 3
+    assert pdbp.get_width("中文abc") == 7
+    assert pdbp.get_width("ｶﾅ") == 2  # Halfwidth
+    assert pdbp.get_width("ＡＢ") == 4  # Fullwidth
+
+
+def test_set_line_width_pads_and_trims():
+    assert pdbp.set_line_width("abc", 5) == "abc  "
+    assert pdbp.set_line_width("abc", 5, tll=False) == "abc"
+    assert pdbp.set_line_width("abcdef", 4) == "abcd"
+    assert pdbp.set_line_width("abc", 0) == ""
+
+
+def test_set_line_width_does_not_split_wide_chars():
+    assert pdbp.set_line_width("中文字", 5) == "中文 "
+    assert pdbp.set_line_width("中文字", 5, tll=False) == "中文"
+    assert pdbp.get_width(pdbp.set_line_width("a中" * 5000, 81)) == 81
+
+
+def test_set_line_width_of_long_line_is_fast():
+    import time
+    start = time.perf_counter()
+    pdbp.set_line_width("中" * 200000, 80)
+    assert time.perf_counter() - start < 1